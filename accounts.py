@@ -0,0 +1,49 @@
+import re
+
+from sqlalchemy import insert
+
+from models import User
+
+CONFLICT_MESSAGES = {"username": "Username already taken", "email": "Email already in use"}
+
+# unique index or constraint name -> the column it guards, as Postgres
+# reports it (ix_users_username from the models and migrations, or the
+# users_username_key Postgres names a plain UNIQUE constraint)
+UNIQUE_COLUMNS = {
+    **{f"users_{column}_key": column for column in CONFLICT_MESSAGES},
+    **{index.name: index.columns[0].name for index in User.__table__.indexes if index.unique and len(index.columns) == 1},
+}
+
+# SQLite: "UNIQUE constraint failed: users.username"
+SQLITE_UNIQUE_RE = re.compile(r"UNIQUE constraint failed: (.*)")
+
+def insert_user_statement(username, email, password):
+    return insert(User).values(username=username, email=email, password=password)
+
+def _conflicting_columns(orig):
+    # psycopg2 has the constraint under diag, asyncpg on the exception the
+    # driver adapter wraps
+    for source in (getattr(orig, "diag", None), orig, getattr(orig, "__cause__", None)):
+        name = getattr(source, "constraint_name", None)
+        if name:
+            return [UNIQUE_COLUMNS.get(name)]
+    match = SQLITE_UNIQUE_RE.search(str(orig))
+    if match:
+        return [
+            column for table, _, column in (token.strip().partition(".") for token in match.group(1).split(","))
+            if table == User.__tablename__
+        ]
+    return []
+
+def registration_conflict(error):
+    """Map an IntegrityError from inserting a user to the API's error message.
+
+    The unique indexes on users.username and users.email do the checking, so
+    registration is one INSERT. The failing column comes from the constraint
+    name on Postgres and the users.<column> token of SQLite's message.
+    Returns None for anything else.
+    """
+    for column in _conflicting_columns(getattr(error, "orig", error)):
+        if column in CONFLICT_MESSAGES:
+            return CONFLICT_MESSAGES[column]
+    return None
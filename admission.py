@@ -0,0 +1,217 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+import metrics
+
+# Every request is admitted through one of three pools before it runs:
+# "sql" for /sql, "write" for other POST/PUT/PATCH/DELETE routes and "read"
+# for the rest (and /login, which only reads). Each pool runs at most
+# `concurrency` requests at once and lets at most `queue` more wait, each
+# for up to `wait_ms`; anything past that gets a 503 with Retry-After, so a
+# pile of heavy /sql queries or bulk uploads can't take every worker thread
+# (and the single SQLite write connection) away from ordinary reads.
+# Optionally each client also gets a token bucket per pool: `rate`
+# requests per second with bursts of `burst`, a 429 once it's empty.
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1").lower() in ("1", "true", "yes")
+
+# take the client address from this header (e.g. X-Forwarded-For behind a
+# proxy) instead of the connection, only set it when the proxy overwrites it
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "").lower()
+
+# client buckets kept at most, idle full ones are dropped first
+MAX_CLIENTS = 10000
+
+# routes admission control never holds up
+EXEMPT_PATHS = {"/metrics"}
+
+READ_ONLY_POSTS = {"/login"}
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# concurrency, queue, wait_ms, rate, burst; ADMISSION_<POOL>_<SETTING> overrides
+POOL_DEFAULTS = {
+    "sql": (4, 16, 5000, 0, 10),
+    "write": (8, 64, 2000, 0, 20),
+    "read": (64, 256, 2000, 0, 50),
+}
+
+class Rejected(Exception):
+    def __init__(self, status_code, reason, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+def pool_settings(name):
+    settings = {}
+    for key, default in zip(("concurrency", "queue", "wait_ms", "rate", "burst"), POOL_DEFAULTS[name]):
+        settings[key] = float(os.getenv(f"ADMISSION_{name.upper()}_{key.upper()}", default))
+    return settings
+
+def pool_for(method, path):
+    if path == "/sql":
+        return "sql"
+    if method in WRITE_METHODS and path not in READ_ONLY_POSTS:
+        return "write"
+    return "read"
+
+class TokenBuckets:
+    """Per-client token buckets: `rate` tokens a second, holding at most `burst`."""
+
+    def __init__(self, rate, burst, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        # client -> (tokens, when they were counted)
+        self._buckets = {}
+
+    def take(self, client):
+        """Spend a token, returning 0 or how many seconds until one is due."""
+        now = time.monotonic()
+        tokens, counted = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - counted) * self.rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            return (1 - tokens) / self.rate
+        if client not in self._buckets and len(self._buckets) >= self.max_clients:
+            self._prune(now)
+        self._buckets[client] = (tokens - 1, now)
+        return 0
+
+    def _prune(self, now):
+        # a bucket that has refilled is the same as no bucket
+        full = [client for client, (tokens, counted) in self._buckets.items()
+                if tokens + (now - counted) * self.rate >= self.burst]
+        for client in full:
+            del self._buckets[client]
+        if len(self._buckets) >= self.max_clients:
+            self._buckets.clear()
+
+class AdmissionPool:
+    """Bounded concurrency with a bounded, time-limited FIFO of waiters.
+
+    Runs on the event loop only, so plain counters need no lock. A slot
+    freed by release() goes straight to the oldest waiter.
+    """
+
+    def __init__(self, name, concurrency, queue, wait_ms, rate=0, burst=1):
+        self.name = name
+        self.concurrency = max(int(concurrency), 1)
+        self.max_queue = int(queue)
+        self.wait = wait_ms / 1000
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.in_flight = 0
+        self._waiters = deque()
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def check_client(self, client):
+        if self.buckets is None:
+            return
+        wait = self.buckets.take(client)
+        if wait:
+            raise Rejected(429, "client_rate", "Too many requests from this client, slow down", wait)
+
+    async def acquire(self):
+        if self.in_flight < self.concurrency and not self._waiters:
+            self._admitted(0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+
+        started = time.monotonic()
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        self._update_depth()
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), self.wait)
+        except asyncio.TimeoutError:
+            if not slot.done():
+                slot.cancel()
+                self._waiters.remove(slot)
+                raise self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            # the client went away while waiting
+            if slot.done():
+                self.release()
+            else:
+                slot.cancel()
+                self._waiters.remove(slot)
+            raise
+        finally:
+            self._update_depth()
+        # release() already counted us in
+        metrics.ADMISSION_WAIT.observe(time.monotonic() - started, self.name)
+
+    def release(self):
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)  # the slot passes on, in_flight stays
+                self._update_depth()
+                return
+        self.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+
+    def _admitted(self, waited):
+        self.in_flight += 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+        metrics.ADMISSION_WAIT.observe(waited, self.name)
+
+    def _update_depth(self):
+        metrics.ADMISSION_QUEUE_DEPTH.set(len(self._waiters), self.name)
+
+    def _shed(self, reason):
+        # a client retrying after about one queue wait finds it drained
+        return Rejected(503, reason, "Server is busy, please try again shortly", max(self.wait, 1))
+
+pools = {name: AdmissionPool(name, **pool_settings(name)) for name in POOL_DEFAULTS}
+
+def client_address(scope):
+    if ADMISSION_CLIENT_HEADER:
+        for name, value in scope["headers"]:
+            if name.decode("latin-1") == ADMISSION_CLIENT_HEADER:
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class AdmissionMiddleware:
+    """ASGI middleware holding each request to its pool's limits.
+
+    The slot is held until the response has been sent in full, so a
+    streamed /sql result counts for as long as it keeps the database busy.
+    """
+
+    def __init__(self, app, pools=pools):
+        self.app = app
+        self.pools = pools
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        pool = self.pools[pool_for(scope["method"], scope["path"])]
+        try:
+            pool.check_client(client_address(scope))
+            await pool.acquire()
+        except Rejected as rejected:
+            metrics.ADMISSION_REJECTIONS.inc(pool.name, rejected.reason)
+            response = JSONResponse(
+                {"detail": rejected.detail}, status_code=rejected.status_code,
+                headers={"Retry-After": str(math.ceil(rejected.retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import DateTime, Integer, Text, bindparam, exists, insert, select
+from sqlalchemy.exc import DBAPIError
+
+import metrics
+from database import engine
+from models import Adoption
+
+logger = logging.getLogger(__name__)
+
+# acknowledge /adopt at once and write the rows in batches from a
+# background thread, one commit (one fsync) per batch instead of per request
+WRITE_BEHIND_ADOPTIONS = os.getenv("WRITE_BEHIND_ADOPTIONS", "").lower() in ("1", "true", "yes")
+
+# requests held in memory at most; past that, submitters wait up to
+# ADOPTION_QUEUE_WAIT seconds for room and then get a 503
+ADOPTION_QUEUE_SIZE = int(os.getenv("ADOPTION_QUEUE_SIZE", "10000"))
+ADOPTION_QUEUE_WAIT = float(os.getenv("ADOPTION_QUEUE_WAIT", "2"))
+
+# rows per commit, and how long the writer lets a batch fill up
+ADOPTION_BATCH_SIZE = int(os.getenv("ADOPTION_BATCH_SIZE", "500"))
+ADOPTION_FLUSH_MS = float(os.getenv("ADOPTION_FLUSH_MS", "50"))
+
+# how long shutdown waits for the queue to drain
+ADOPTION_SHUTDOWN_TIMEOUT = float(os.getenv("ADOPTION_SHUTDOWN_TIMEOUT", "30"))
+
+# a batch that finds the database busy is retried this many times, a second
+# apart, before it's written row by row like any other failed batch; rows
+# get a couple of tries of their own
+ADOPTION_WRITE_RETRIES = int(os.getenv("ADOPTION_WRITE_RETRIES", "30"))
+ROW_WRITE_RETRIES = 2
+
+# errors that mean "another writer has the lock, try again": SQLite's
+# SQLITE_BUSY and SQLITE_LOCKED (low byte of the extended code), Postgres'
+# serialization failure, deadlock and lock not available
+BUSY_SQLITE_CODES = {5, 6}
+BUSY_POSTGRES_CODES = {"40001", "40P01", "55P03"}
+
+# a request already stored for the same user and animal is skipped, so a
+# retried submission can't add a second row
+_user_id = bindparam("user_id", type_=Integer)
+_animal_id = bindparam("animal_id", type_=Integer)
+INSERT_NEW_ADOPTION = insert(Adoption).from_select(
+    ["user_id", "animal_id", "message", "created_at"],
+    select(
+        _user_id, _animal_id, bindparam("message", type_=Text), bindparam("created_at", type_=DateTime(timezone=True)),
+    ).where(~exists().where(Adoption.user_id == _user_id, Adoption.animal_id == _animal_id)),
+)
+
+class QueueFull(Exception):
+    pass
+
+def is_transient(error):
+    """True for errors a retry can get past: a busy database or a dropped connection."""
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    code = getattr(error.orig, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in BUSY_SQLITE_CODES
+    return getattr(error.orig, "pgcode", None) in BUSY_POSTGRES_CODES
+
+def accepted_response(queued):
+    # 202: the request is safe in the queue but not committed yet
+    if not queued:
+        return JSONResponse({"message": "Adoption request already submitted", "duplicate": True}, status_code=202)
+    return JSONResponse({"message": "Adoption request submitted"}, status_code=202)
+
+def queue_full_error():
+    return HTTPException(
+        status_code=503,
+        detail="Too many adoption requests right now, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+class AdoptionQueue:
+    """Bounded in-memory queue of adoption requests with a group-commit writer.
+
+    submit() returns True once a request is queued and False when the same
+    (user_id, animal_id) is already waiting to be written. A writer thread,
+    started on first use, takes up to batch_size requests at a time and
+    inserts them in one transaction. close() writes whatever is left.
+    """
+
+    def __init__(self, max_size=ADOPTION_QUEUE_SIZE, batch_size=ADOPTION_BATCH_SIZE,
+                 flush_interval=ADOPTION_FLUSH_MS / 1000, wait=ADOPTION_QUEUE_WAIT, bind=engine):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.wait = wait
+        self.bind = bind
+        self._items = deque()
+        # (user_id, animal_id) of everything queued or being written
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def submit(self, adoption, wait=None):
+        """Queue an adoption dict; raises QueueFull if no room frees up in time."""
+        try:
+            return self._offer(adoption, self.wait if wait is None else wait)
+        except QueueFull:
+            metrics.ADOPTION_QUEUE_EVENTS.inc("rejected")
+            raise
+
+    async def submit_async(self, adoption):
+        # only a full queue blocks, and only then is a threadpool hop worth it
+        try:
+            return self._offer(adoption, 0)
+        except QueueFull:
+            if self._closed or not self.wait:
+                metrics.ADOPTION_QUEUE_EVENTS.inc("rejected")
+                raise
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.submit, adoption)
+
+    def _offer(self, adoption, wait):
+        key = (adoption["user_id"], adoption["animal_id"])
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise QueueFull("adoption queue is shut down")
+                if key in self._keys:
+                    metrics.ADOPTION_QUEUE_EVENTS.inc("duplicate")
+                    return False
+                if len(self._items) < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueueFull("adoption queue is full")
+                self._not_full.wait(remaining)
+
+            self._items.append({**adoption, "created_at": datetime.now(timezone.utc)})
+            self._keys.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="adoption-writer", daemon=True)
+                self._thread.start()
+            self._not_empty.notify()
+        metrics.ADOPTION_QUEUE_EVENTS.inc("queued")
+        return True
+
+    def _next_batch(self):
+        with self._lock:
+            while not self._items and not self._closed:
+                self._not_empty.wait()
+            # give a burst a moment to pile up into one commit
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._items) < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+            self._not_full.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # closed and drained
+            self._write(batch)
+            with self._lock:
+                self._keys.difference_update((row["user_id"], row["animal_id"]) for row in batch)
+
+    def _write(self, batch):
+        # these requests were already acknowledged, so a batch the database
+        # rejects (a bad row, or a lock that never clears) is written row by
+        # row and only the rows that fail themselves are dropped
+        written, error = self._insert(batch, ADOPTION_WRITE_RETRIES)
+        failed = 0
+        if error is not None:
+            written = 0
+            for row in batch:
+                row_written, row_error = self._insert([row], ROW_WRITE_RETRIES)
+                written += row_written
+                if row_error is not None:
+                    failed += 1
+                    logger.error(
+                        "dropping queued adoption request (user %s, animal %s): %s",
+                        row["user_id"], row["animal_id"], row_error,
+                    )
+        metrics.ADOPTION_BATCH_ROWS.observe(len(batch))
+        metrics.ADOPTION_QUEUE_EVENTS.inc("written", amount=written)
+        metrics.ADOPTION_QUEUE_EVENTS.inc("failed", amount=failed)
+        metrics.ADOPTION_QUEUE_EVENTS.inc("skipped", amount=len(batch) - written - failed)
+
+    def _insert(self, rows, retries):
+        """Insert rows in one transaction, returning (rows written, error or None).
+
+        A busy database or dropped connection is retried up to `retries`
+        times; anything else (a bad row, a missing table, a read-only or
+        failing disk) is returned straight away.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.bind.begin() as conn:
+                    written = conn.execute(INSERT_NEW_ADOPTION, rows).rowcount
+                break
+            except Exception as e:
+                if not is_transient(e) or attempt >= retries:
+                    return 0, e
+                attempt += 1
+                logger.warning("writing %d queued adoption requests failed, retrying: %s", len(rows), e)
+                time.sleep(1)
+        if written is None or written < 0:
+            written = len(rows)
+        return written, None
+
+    def close(self, timeout=ADOPTION_SHUTDOWN_TIMEOUT):
+        """Stop taking requests and wait for the queued ones to be written."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error("shut down with %d adoption requests still unwritten", len(self))
+
+adoption_queue = AdoptionQueue()
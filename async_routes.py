@@ -0,0 +1,262 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import User, Animal as AnimalModel, Center as CenterModel, Adoption
+from schemas import UserCreate, UserLogin, Center, AdoptionCreate, AnimalCreate, AnimalUpdate
+from sample_data import MAX_GENERATED_ROWS, create_sample_data, generate_sample_data
+from database import get_async_db
+from sql_engine import AsyncSimpleSQL
+from sql_http import read_sql_request, run_sql_request
+from cache import response_cache, cached_response_async
+from security import check_password_async, hash_password_async, reject_unknown_user_async
+from accounts import insert_user_statement, registration_conflict
+from catalog import animal_page, animals_statement, page_position, centers_statement, serialize_center_row
+from search import search_animals_page
+from facets import facet_counts
+from changes import MAX_CHANGES, changes_since, reset_change_log
+from serialization import FastJSONResponse
+from geo import MAX_RADIUS_KM, nearby_centers_page
+from ingest import ingest_animals, load_animal_chunk, upload_records
+from adoption_queue import WRITE_BEHIND_ADOPTIONS, QueueFull, accepted_response, adoption_queue, queue_full_error
+from typing import Optional
+
+# The API routes again, on AsyncSession. main.py registers these ahead of
+# the sync routes when ASYNC_DB is on; anything without an async twin here
+# falls through to the sync version.
+router = APIRouter()
+
+@router.post("/register")
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # create new user (bcrypt runs in the hash worker processes); the unique
+    # indexes reject a taken username or email, no need to look first
+    hashed_password = await hash_password_async(user.password)
+    try:
+        await db.execute(insert_user_statement(user.username, user.email, hashed_password))
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        detail = registration_conflict(e)
+        if detail is None:
+            raise
+        raise HTTPException(status_code=400, detail=detail)
+    return {"message": "Account created successfully"}
+
+@router.post("/login")
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(select(User).filter(User.username == user.username))).scalars().first()
+    if not db_user:
+        await reject_unknown_user_async()
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    valid, new_hash = await check_password_async(user.password, db_user.password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # legacy SHA-256 hash (or an old cost factor), store the bcrypt one
+        await db.execute(
+            update(User)
+            .where(User.id == db_user.id, User.password == db_user.password)
+            .values(password=new_hash)
+        )
+        await db.commit()
+    return {"message": "Login successful", "user_id": db_user.id}
+
+@router.get("/animals")
+async def get_animals(
+    request: Request,
+    species: Optional[str] = None,
+    breed: Optional[str] = None,
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    center_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = Query("id", regex="^-?(id|name|species|age)$"),
+    fmt: Optional[str] = Query(None, alias="format", regex="^columnar$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        after = page_position(sort, after_id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def build(headers):
+        statement = animals_statement(species, breed, min_age, max_age, center_id, after, limit, sort)
+        return animal_page((await db.execute(statement)).all(), limit, headers, fmt == "columnar", sort)
+
+    return await cached_response_async(request, ("animals", "centers"), build, db)
+
+@router.get("/animals/facets")
+async def get_animal_facets(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build(headers):
+        return await db.run_sync(facet_counts)
+
+    return await cached_response_async(request, ("animals",), build, db)
+
+@router.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=MAX_CHANGES),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return FastJSONResponse(await db.run_sync(changes_since, since, limit))
+
+@router.get("/animals/search")
+async def search_animals(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    fmt: Optional[str] = Query(None, alias="format", regex="^columnar$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def build(headers):
+        return await db.run_sync(search_animals_page, q, limit, offset, fmt == "columnar", headers)
+
+    return await cached_response_async(request, ("animals", "centers"), build, db)
+
+@router.get("/centers", response_model=list[Center])
+async def get_centers(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build(headers):
+        return [serialize_center_row(row) for row in await db.execute(centers_statement())]
+
+    try:
+        return await cached_response_async(request, ("centers",), build, db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/centers/nearby")
+async def get_nearby_centers(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(50, gt=0, le=MAX_RADIUS_KM),
+    species: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def build(headers):
+        return await db.run_sync(nearby_centers_page, lat, lon, radius, species, limit)
+
+    return await cached_response_async(request, ("animals", "centers"), build, db)
+
+@router.post("/adopt")
+async def adopt(adoption: AdoptionCreate, db: AsyncSession = Depends(get_async_db)):
+    if WRITE_BEHIND_ADOPTIONS:
+        try:
+            queued = await adoption_queue.submit_async(adoption.dict())
+        except QueueFull:
+            raise queue_full_error()
+        return accepted_response(queued)
+
+    await db.execute(insert(Adoption).values(**adoption.dict()))
+    await db.commit()
+    return {"message": "Adoption request submitted"}
+
+@router.post("/animals")
+async def create_animal(animal: AnimalCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        # Convert to dict and handle empty image
+        animal_data = animal.dict()
+        if not animal_data.get('image'):
+            animal_data['image'] = f"https://picsum.photos/400/300?random={animal_data['center_id']}"
+
+        # the new id comes back from the INSERT itself (lastrowid / RETURNING)
+        result = await db.execute(insert(AnimalModel).values(**animal_data))
+        await db.commit()
+        response_cache.bump("animals")
+        return {"message": "Animal created successfully", "id": result.inserted_primary_key[0]}
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating animal: {str(e)}")
+
+@router.post("/animals/bulk")
+async def bulk_create_animals(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", regex="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    records = upload_records(request, fmt)
+
+    async def load_chunk(chunk):
+        return await db.run_sync(load_animal_chunk, chunk)
+
+    return await ingest_animals(records, load_chunk, on_insert=lambda: response_cache.bump("animals"))
+
+@router.put("/animals/{animal_id}")
+async def update_animal(animal_id: int, animal: AnimalUpdate, db: AsyncSession = Depends(get_async_db)):
+    update_data = animal.dict(exclude_unset=True)
+    if not update_data:
+        # nothing to change, but still tell the caller if the animal is missing
+        found = (await db.execute(select(AnimalModel.id).where(AnimalModel.id == animal_id))).first()
+        if not found:
+            raise HTTPException(status_code=404, detail="Animal not found")
+        return {"message": "Animal updated successfully"}
+
+    # one UPDATE by id, the rowcount says whether the animal exists
+    result = await db.execute(update(AnimalModel).where(AnimalModel.id == animal_id).values(**update_data))
+    await db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Animal not found")
+    response_cache.bump("animals")
+    return {"message": "Animal updated successfully"}
+
+@router.delete("/animals/{animal_id}")
+async def delete_animal(animal_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(delete(AnimalModel).where(AnimalModel.id == animal_id))
+    await db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Animal not found")
+    response_cache.bump("animals")
+    return {"message": "Animal deleted successfully"}
+
+@router.post("/sql")
+async def execute_sql(request: dict, http_request: Request, db: AsyncSession = Depends(get_async_db)):
+    options = read_sql_request(request)
+    if 'error' in options:
+        return options
+
+    sql_engine = AsyncSimpleSQL(
+        db, on_write=response_cache.bump_all,
+        timeout=options["timeout"], max_scan_steps=options["max_scan_steps"],
+    )
+    return await run_sql_request(http_request, sql_engine, options, sql_engine.execute_query)
+
+@router.post("/reset-db")
+async def reset_database(db: AsyncSession = Depends(get_async_db)):
+    try:
+        # Clear all data
+        for model in (Adoption, AnimalModel, CenterModel, User):
+            await db.execute(delete(model))
+        await db.run_sync(reset_change_log)
+        await db.commit()
+        response_cache.bump_all()
+        return {"message": "Database reset successfully"}
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error resetting database: {str(e)}")
+
+@router.post("/load-sample-data")
+async def load_sample_data_endpoint(
+    animals: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    centers: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    users: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    adoptions: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    seed: int = 0,
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        if animals is None:
+            await db.run_sync(create_sample_data)
+            loaded = None
+        else:
+            loaded = await db.run_sync(generate_sample_data, animals, centers, users, adoptions, seed)
+        response_cache.bump("animals", "centers")
+        return {"message": "Sample data loaded successfully", "loaded": loaded}
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error loading sample data: {str(e)}")
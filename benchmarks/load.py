@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""HTTP load suite for the API and the SQL engine.
+
+For each --sizes value a throwaway SQLite database is migrated and seeded
+with the data generator (N animals plus the default centers, users and
+adoptions), then every scenario is driven at every --concurrency level.
+Each result has throughput, p50/p95/p99 latency and the average number of
+database statements per request, read from the server's /metrics.
+
+    python -m benchmarks.load --sizes 1000,100000 --concurrency 1,8 --output run.json
+    python -m benchmarks.load --baseline run.json     # compare, exit 1 on regressions
+
+--in-process serves the app from a thread of this process (easier to
+profile, but the client threads then share its GIL); by default it runs
+under uvicorn in a subprocess.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from benchmarks.server import (
+    ROOT, drive, in_process_server, live_server, prepare_database, read_metric, summarize,
+)
+
+SPECIES = ["Dog", "Cat", "Rabbit", "Bird"]
+
+SQL_QUERIES = [
+    ("SELECT species, count(*) AS n FROM animals GROUP BY species", None),
+    ("SELECT id, name, breed, age FROM animals WHERE center_id = :center ORDER BY id LIMIT 50", "center"),
+    ("SELECT id, name FROM animals WHERE species = 'Cat' AND age <= :age ORDER BY id DESC LIMIT 20", "age"),
+]
+
+
+def scenario_animals(rng, data):
+    # a mix of plain pages, filtered pages and deeper keyset pages, so the
+    # response cache sees both hits and misses
+    while True:
+        params = {"limit": 50}
+        if rng.random() < 0.5:
+            params["species"] = rng.choice(SPECIES)
+        if rng.random() < 0.2:
+            params["max_age"] = rng.randrange(1, 10)
+        if rng.random() < 0.5:
+            params["after_id"] = rng.randrange(1, data["animals"] + 1)
+        yield "GET", "/animals?" + urlencode(params), None
+
+
+def scenario_centers(rng, data):
+    while True:
+        yield "GET", "/centers", None
+
+
+def scenario_login(rng, data):
+    # generated users all have the password "password"
+    while True:
+        user_id = rng.randrange(1, data["users"] + 1)
+        yield "POST", "/login", {"username": f"user{user_id}", "password": "password"}
+
+
+def scenario_adopt(rng, data):
+    while True:
+        yield "POST", "/adopt", {
+            "user_id": rng.randrange(1, data["users"] + 1),
+            "animal_id": rng.randrange(1, data["animals"] + 1),
+            "message": "Benchmark adoption request",
+        }
+
+
+def scenario_animal_writes(rng, data):
+    # create an animal, update it, delete it, over and over
+    while True:
+        status, created = yield "POST", "/animals", {
+            "name": "Bench", "species": rng.choice(SPECIES), "breed": "Mixed Breed",
+            "age": rng.randrange(0, 15), "description": "Created by the load suite",
+            "center_id": rng.randrange(1, data["centers"] + 1),
+        }
+        if status != 200:
+            continue
+        yield "PUT", f"/animals/{created['id']}", {"age": rng.randrange(0, 15)}
+        yield "DELETE", f"/animals/{created['id']}", None
+
+
+def scenario_sql(rng, data):
+    while True:
+        query, param = rng.choice(SQL_QUERIES)
+        params = {}
+        if param == "center":
+            params["center"] = rng.randrange(1, data["centers"] + 1)
+        elif param == "age":
+            params["age"] = rng.randrange(0, 10)
+        yield "POST", "/sql", {"query": query, "params": params}
+
+
+SCENARIOS = {
+    "animals": scenario_animals,
+    "centers": scenario_centers,
+    "login": scenario_login,
+    "adopt": scenario_adopt,
+    "animal_writes": scenario_animal_writes,
+    "sql": scenario_sql,
+}
+
+
+def data_counts(animals):
+    # the generator's defaults, see sample_data.generate_sample_data
+    return {"animals": animals, "centers": max(4, animals // 2500), "users": max(1, animals // 10)}
+
+
+def statement_totals(port):
+    # every route but /metrics itself
+    sums = read_metric(port, "http_request_db_statements_sum")
+    counts = read_metric(port, "http_request_db_statements_count")
+    total = sum(value for labels, value in sums.items() if labels[1] != "/metrics")
+    count = sum(value for labels, value in counts.items() if labels[1] != "/metrics")
+    return total, count
+
+
+def run_scenario(port, name, data, concurrency, duration, warmup, seed):
+    def make_client(index):
+        return SCENARIOS[name](random.Random(f"{seed}-{name}-{index}"), data)
+
+    if warmup:
+        drive(port, concurrency, warmup, make_client)
+    statements_before, requests_before = statement_totals(port)
+    result = summarize(*drive(port, concurrency, duration, make_client))
+    statements_after, requests_after = statement_totals(port)
+    served = requests_after - requests_before
+    result["db_statements_per_request"] = round((statements_after - statements_before) / served, 2) if served else None
+    return result
+
+
+def run_size(animals, args, env, port=None):
+    """Seed a database of the given size and run every scenario against it."""
+    data = data_counts(animals)
+    results = []
+
+    def run_all(port):
+        for concurrency in args.concurrency:
+            for name in args.scenarios:
+                result = run_scenario(port, name, data, concurrency, args.duration, args.warmup, args.seed)
+                results.append({"size": animals, "scenario": name, "concurrency": concurrency, **result})
+                print_result(results[-1])
+
+    if args.in_process:
+        # one server for the whole run, the database file is swapped under it
+        import database
+        from cache import response_cache
+        database.engine.dispose()
+        database.read_engine.dispose()
+        if database.async_engine is not None:
+            database.async_engine.sync_engine.dispose()
+        path = database.SQLALCHEMY_DATABASE_URL.split("///", 1)[1]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        prepare_database(database.SQLALCHEMY_DATABASE_URL, animals, args.seed, env)
+        response_cache.clear()
+        run_all(port)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{tmp}/load.db"
+            prepare_database(database_url, animals, args.seed, env)
+            with live_server(env, database_url=database_url) as server_port:
+                run_all(server_port)
+    return results
+
+
+def print_result(result):
+    print(
+        f"{result['size']:>9} {result['scenario']:<14} {result['concurrency']:>4} {result['rps']:>9} "
+        f"{result['p50_ms']!s:>8} {result['p95_ms']!s:>8} {result['p99_ms']!s:>8} "
+        f"{result['db_statements_per_request']!s:>6} {result['errors']:>6}"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print throughput and p95 changes against a baseline run, return the regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = []
+    compared = 0
+    print(f"\nagainst {baseline_path} (tolerance {tolerance:.0%}):")
+    for result in results:
+        key = (result["size"], result["scenario"], result["concurrency"])
+        before = baseline.get(key)
+        if before is None or not before["rps"] or not before["p95_ms"] or result["p95_ms"] is None:
+            continue
+        compared += 1
+        rps_change = result["rps"] / before["rps"] - 1
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1
+        regressed = rps_change < -tolerance or p95_change > tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"  {key[0]:>9} {key[1]:<14} {key[2]:>4}  rps {rps_change:+7.1%}  p95 {p95_change:+7.1%}"
+              + ("  REGRESSION" if regressed else ""))
+    if not compared:
+        print("  no results in common (sizes, scenarios and concurrency must match)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="1000,100000", help="comma-separated animal counts to seed")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated client thread counts")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1, help="unmeasured seconds before each scenario")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the data set and the request mix")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10, help="password hashing cost for the server")
+    parser.add_argument("--in-process", action="store_true", help="serve from this process instead of uvicorn")
+    parser.add_argument("--async-db", action="store_true", help="run the server with ASYNC_DB=1")
+    parser.add_argument("--admission-control", action="store_true",
+                        help="keep admission control on (off by default, it sheds load the benchmark means to measure)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed rps drop / p95 rise before a regression")
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    env = {"BCRYPT_ROUNDS": str(args.bcrypt_rounds), "ADMISSION_CONTROL": "1" if args.admission_control else "0"}
+    if args.async_db:
+        env["ASYNC_DB"] = "1"
+
+    print(f"{'size':>9} {'scenario':<14} {'conc':>4} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'stmts':>6} {'errors':>6}")
+    results = []
+    sizes = [int(value) for value in args.sizes.split(",")]
+    if args.in_process:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ.update(env, DATABASE_URL=f"sqlite:///{tmp.name}/load.db")
+        with tmp, in_process_server() as port:
+            for animals in sizes:
+                results.extend(run_size(animals, args, env, port))
+    else:
+        for animals in sizes:
+            results.extend(run_size(animals, args, env))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "revision": git_revision(),
+                    "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(),
+                    "mode": "in-process" if args.in_process else "uvicorn",
+                    "async_db": args.async_db,
+                    "duration": args.duration,
+                    "bcrypt_rounds": args.bcrypt_rounds,
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
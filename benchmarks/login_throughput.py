@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Login throughput against a live server, by number of hash workers.
+
+Starts uvicorn on a scratch SQLite database once per HASH_WORKERS value,
+registers a user and then has --concurrency client threads POST /login for
+--duration seconds. Requests per second should grow with the worker count
+until it reaches the number of cores.
+
+    python -m benchmarks.login_throughput --workers 1,2,4 --rounds 10
+"""
+import argparse
+import json
+import os
+
+from benchmarks.server import drive, live_server, post, summarize
+
+
+def hammer(port, credentials, concurrency, duration):
+    def make_client(index):
+        while True:
+            yield "POST", "/login", credentials
+
+    return summarize(*drive(port, concurrency, duration, make_client))
+
+
+def run(workers, rounds, concurrency, duration, async_db):
+    env = {"HASH_WORKERS": str(workers), "BCRYPT_ROUNDS": str(rounds)}
+    if async_db:
+        env["ASYNC_DB"] = "1"
+    with live_server(env) as port:
+        credentials = {"username": "bench", "password": "correct horse battery staple"}
+        post(port, "/register", {**credentials, "email": "bench@example.com"})
+        # the first login spawns the worker processes, keep it out of the numbers
+        post(port, "/login", credentials)
+        result = hammer(port, credentials, concurrency or workers * 2, duration)
+    return {"workers": workers, "bcrypt_rounds": rounds, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", default=",".join(str(2 ** i) for i in range((os.cpu_count() or 1).bit_length())),
+                        help="comma-separated HASH_WORKERS values (default: powers of two up to the core count)")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--concurrency", type=int, default=0, help="client threads (default: 2 per worker)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--async-db", action="store_true", help="run the server with ASYNC_DB=1")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>8}")
+    for workers in [int(value) for value in args.workers.split(",")]:
+        result = run(workers, args.rounds, args.concurrency, args.duration, args.async_db)
+        results.append(result)
+        print(f"{workers:>7} {result['rps']:>8} {result['p50_ms']:>8} {result['p99_ms']:>8} {result['errors']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Helpers for benchmarks that drive a live uvicorn server."""
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port, method, path, body=None, timeout=60):
+    """Send one request, returning (status, body bytes)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def post(port, path, body):
+    return request(port, "POST", path, body)[0]
+
+
+@contextmanager
+def live_server(env=None, database_url=None, poll_interval=0.1):
+    """Run uvicorn on a free port (and a scratch SQLite database unless given one).
+
+    A scratch database is migrated and seeded first, as a deploy would.
+    """
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, **(env or {})}
+        if database_url is None:
+            env["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+            subprocess.run([sys.executable, "manage.py", "migrate", "--seed"], cwd=ROOT, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            env["DATABASE_URL"] = database_url
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        )
+        try:
+            deadline = time.time() + 60
+            while True:
+                try:
+                    request(port, "GET", "/test", timeout=1)
+                    break
+                except OSError:
+                    if time.time() > deadline or server.poll() is not None:
+                        raise RuntimeError("server did not start")
+                    time.sleep(poll_interval)
+            yield port
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def prepare_database(database_url, animals=None, seed=0, env=None):
+    """Migrate a database and seed it, with a generated data set if animals is given."""
+    env = {**os.environ, **(env or {}), "DATABASE_URL": database_url}
+    seed_command = ["seed"] if animals is None else ["seed", "--animals", str(animals), "--seed", str(seed)]
+    for command in (["migrate"], seed_command):
+        subprocess.run([sys.executable, "manage.py", *command], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@contextmanager
+def in_process_server(port=None):
+    """Serve main.app from a thread of this process instead of a subprocess.
+
+    DATABASE_URL and friends must be set before this is first called, main
+    is imported on the first call. Handy for profiling the server and the
+    client together.
+    """
+    import uvicorn
+
+    port = port or free_port()
+    config = uvicorn.Config("main:app", port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            if not thread.is_alive():
+                raise RuntimeError("server did not start")
+            time.sleep(0.01)
+        yield port
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def drive(port, concurrency, duration, make_client):
+    """Run concurrency client threads against the server for duration seconds.
+
+    make_client(index) returns a generator yielding (method, path, body)
+    requests; each response comes back in through send() as (status,
+    parsed JSON or None). Statuses of 400 and up count as errors.
+    Returns (latencies in seconds, error count, wall seconds).
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        requests = make_client(index)
+        method, path, body = next(requests)
+        local = []
+        failed = 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = conn.getresponse()
+            payload = response.read()
+            local.append(time.perf_counter() - start)
+            if response.status >= 400:
+                failed += 1
+            try:
+                parsed = json.loads(payload) if payload else None
+            except ValueError:
+                parsed = None
+            method, path, body = requests.send((response.status, parsed))
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def summarize(latencies, errors, wall):
+    """Throughput and latency percentiles (nearest rank) for a drive() run."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[max(0, int(round(p / 100 * len(ordered))) - 1)] * 1000, 2)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / wall, 1) if wall else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 2) if ordered else None,
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+METRIC_LINE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+
+
+def read_metric(port, name):
+    """Return {label tuple: value} for one metric family from /metrics."""
+    _, body = request(port, "GET", "/metrics")
+    values = {}
+    for line in body.decode().splitlines():
+        match = METRIC_LINE.match(line)
+        if match and match.group(1) == name:
+            labels = tuple(re.findall(r'\w+="((?:[^"\\]|\\.)*)"', match.group(2)))
+            values[labels] = float(match.group(3))
+    return values
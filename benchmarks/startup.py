@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Cold-start cost: importing main, becoming ready and serving the first requests.
+
+Each run uses a fresh interpreter against an already migrated and seeded
+database, as a new worker would see it.
+- import_ms: `import main` in a fresh interpreter
+- ready_ms: from spawning uvicorn until GET /test answers
+- first_request_ms: the first GET /animals (first connection, cold caches)
+
+    python -m benchmarks.startup [--runs 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.server import ROOT, live_server, request
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def time_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def time_server(database_url):
+    start = time.perf_counter()
+    with live_server(database_url=database_url, poll_interval=0.005) as port:
+        ready = time.perf_counter()
+        status, _ = request(port, "GET", "/animals")
+        first = time.perf_counter()
+        if status != 200:
+            raise RuntimeError(f"GET /animals returned {status}")
+    return (ready - start) * 1000, (first - ready) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/bench.db"
+        env = {**os.environ, "DATABASE_URL": database_url}
+        subprocess.run([sys.executable, "manage.py", "migrate", "--seed"], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        samples = {"import_ms": [], "ready_ms": [], "first_request_ms": []}
+        for _ in range(args.runs):
+            samples["import_ms"].append(time_import(env))
+            ready, first = time_server(database_url)
+            samples["ready_ms"].append(ready)
+            samples["first_request_ms"].append(first)
+
+    results = {name: {"median": round(statistics.median(values), 1), "max": round(max(values), 1)}
+               for name, values in samples.items()}
+    for name, result in results.items():
+        print(f"{name:<18} median {result['median']:>8.1f}  max {result['max']:>8.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Database statements per request on the write paths.
+
+Drives register, login, adopt and the animal create/update/delete routes on
+a live server, then reads http_request_db_statements from /metrics and
+checks each route against its statement budget. Exits non-zero when a route
+goes over. The exact count for each path (success, conflict, 404) is
+asserted in tests/test_write_statements.py; this script adds latency.
+
+    python -m benchmarks.write_statements [--async-db] [--output results.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.server import live_server, read_metric, request
+
+# most statements a single request to the route may run
+BUDGETS = {
+    ("POST", "/register"): 1,
+    ("POST", "/login"): 1,
+    ("POST", "/adopt"): 1,
+    ("POST", "/animals"): 1,
+    ("PUT", "/animals/{animal_id}"): 1,
+    ("DELETE", "/animals/{animal_id}"): 1,
+}
+
+
+def exercise(port, repeat):
+    """Hit every budgeted route repeat times, returning mean latency per route."""
+    timings = {key: [] for key in BUDGETS}
+
+    def call(method, route, path, body=None, expect=200):
+        start = time.perf_counter()
+        status, payload = request(port, method, path, body)
+        timings[(method, route)].append(time.perf_counter() - start)
+        if status != expect:
+            raise RuntimeError(f"{method} {path}: expected {expect}, got {status} {payload[:200]!r}")
+        return json.loads(payload)
+
+    for i in range(repeat):
+        user = {"username": f"bench{i}", "email": f"bench{i}@example.com", "password": "secret"}
+        call("POST", "/register", "/register", user)
+        call("POST", "/register", "/register", user, expect=400)
+        call("POST", "/login", "/login", {"username": user["username"], "password": "secret"})
+        call("POST", "/login", "/login", {"username": "nobody", "password": "secret"}, expect=400)
+        animal = {
+            "name": f"Bench {i}", "species": "Dog", "breed": "Mixed", "age": 3,
+            "description": "Statement counting", "center_id": 1,
+        }
+        animal_id = call("POST", "/animals", "/animals", animal)["id"]
+        call("POST", "/adopt", "/adopt", {"user_id": 1, "animal_id": animal_id, "message": "Hello"})
+        call("PUT", "/animals/{animal_id}", f"/animals/{animal_id}", {"age": 4})
+        call("DELETE", "/animals/{animal_id}", f"/animals/{animal_id}")
+        call("PUT", "/animals/{animal_id}", f"/animals/{animal_id}", {"age": 5}, expect=404)
+        call("DELETE", "/animals/{animal_id}", f"/animals/{animal_id}", expect=404)
+
+    return {key: sum(values) / len(values) for key, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the routes")
+    parser.add_argument("--async-db", action="store_true", help="run the server with ASYNC_DB=1")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # the cost factor doesn't change how many statements run, keep it cheap
+    env = {"BCRYPT_ROUNDS": "4"}
+    if args.async_db:
+        env["ASYNC_DB"] = "1"
+    with live_server(env) as port:
+        latencies = exercise(port, args.repeat)
+        sums = read_metric(port, "http_request_db_statements_sum")
+        counts = read_metric(port, "http_request_db_statements_count")
+
+    results = []
+    over_budget = False
+    print(f"{'route':<32} {'statements':>10} {'budget':>6} {'mean ms':>8}")
+    for (method, route), budget in BUDGETS.items():
+        statements = sums[(method, route)] / counts[(method, route)]
+        over_budget |= statements > budget
+        results.append({
+            "method": method, "route": route, "statements": statements,
+            "budget": budget, "mean_ms": round(latencies[(method, route)] * 1000, 2),
+        })
+        flag = "" if statements <= budget else "  OVER BUDGET"
+        print(f"{method + ' ' + route:<32} {statements:>10.2f} {budget:>6} {latencies[(method, route)] * 1000:>8.2f}{flag}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
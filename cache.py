@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from fastapi import Request, Response
+
+from changes import change_log_enabled, current_version
+from serialization import dumps
+
+# Other worker processes (and /sql clients of the same database) can't
+# bump() this process's table versions, so every lookup also keys on a
+# version read from the database: the change log's on SQLite, where
+# triggers log every write to animals and centers. Elsewhere there's no
+# such version and entries are only trusted for RESPONSE_CACHE_TTL
+# seconds; set it to 0 when running a single worker process.
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+
+
+class CacheEntry:
+    __slots__ = ("body", "headers", "etag")
+
+    def __init__(self, body, headers):
+        self.body = body
+        self.headers = headers
+        # strong validator: derived from the exact bytes we send
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class ResponseCache:
+    """In-process LRU cache of serialized read responses.
+
+    Every entry is keyed by the route, its query string and the current
+    version of each table the response was built from. Write paths call
+    bump() for the tables they touched, so stale entries stop matching
+    right away and age out of the LRU on their own.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def versions(self, tables):
+        with self._lock:
+            return tuple(self._versions[t] for t in tables)
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def bump_all(self):
+        # used when we can't tell which tables a write touched (e.g. /sql)
+        with self._lock:
+            for table in list(self._versions):
+                self._versions[table] += 1
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, headers=None):
+        entry = CacheEntry(body, headers or {})
+        if len(body) > self.max_bytes:
+            return entry  # too big to keep, still usable for this response
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+)
+
+
+def data_version(db):
+    """A number that changes whenever another process may have written."""
+    if change_log_enabled(db):
+        return current_version(db)
+    if RESPONSE_CACHE_TTL > 0:
+        return int(time.monotonic() // RESPONSE_CACHE_TTL)
+    return 0
+
+
+def _cache_key(request, tables, version):
+    # read the versions before building so a write that lands mid-build
+    # can only leave behind an entry nobody will ask for again
+    return (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        response_cache.versions(tables),
+        version,
+    )
+
+
+def _store(key, payload, extra_headers):
+    return response_cache.put(key, dumps(payload), extra_headers)
+
+
+def _respond(request, entry):
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def cached_response(request: Request, tables, build, db=None):
+    """Serve a JSON response from the cache, building it on a miss.
+
+    build(headers) is only called when there is no entry for the current
+    table versions and data_version(db); it returns the payload and may
+    fill in extra response headers, which are cached along with the body.
+    Clients that send a matching If-None-Match get a 304 for the price of
+    that one version lookup, with nothing re-queried or re-serialized.
+    Responses that don't come from the database leave out db.
+    """
+    key = _cache_key(request, tables, None if db is None else data_version(db))
+    entry = response_cache.get(key)
+    if entry is None:
+        extra_headers = {}
+        entry = _store(key, build(extra_headers), extra_headers)
+    return _respond(request, entry)
+
+
+async def cached_response_async(request: Request, tables, build, db=None):
+    """cached_response for async routes, build(headers) is awaited."""
+    key = _cache_key(request, tables, None if db is None else await db.run_sync(data_version))
+    entry = response_cache.get(key)
+    if entry is None:
+        extra_headers = {}
+        entry = _store(key, await build(extra_headers), extra_headers)
+    return _respond(request, entry)
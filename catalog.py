@@ -0,0 +1,169 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_, select
+
+from models import Animal as AnimalModel, Center as CenterModel
+
+# columns /animals can be sorted by, prefix with "-" for descending
+ANIMAL_SORT_COLUMNS = {
+    "id": AnimalModel.id,
+    "name": AnimalModel.name,
+    "species": AnimalModel.species,
+    "age": AnimalModel.age,
+}
+
+# Catalog reads select plain columns rather than ORM objects, and the row
+# serializers below index into those tuples directly: building model
+# instances and walking their attributes cost more than the query did.
+ANIMAL_FIELDS = ("id", "name", "species", "breed", "age", "description", "image", "center_id")
+CENTER_FIELDS = ("id", "name", "location", "contact", "latitude", "longitude")
+
+ANIMAL_ROW_COLUMNS = [getattr(AnimalModel, field) for field in ANIMAL_FIELDS] + [
+    getattr(CenterModel, field).label(f"center_{field}") for field in CENTER_FIELDS[:4]
+]
+CENTER_ROW_COLUMNS = [getattr(CenterModel, field) for field in CENTER_FIELDS]
+
+def serialize_animal_row(row):
+    """An animal and its center as the API returns them, from ANIMAL_ROW_COLUMNS."""
+    return {
+        "id": row[0],
+        "name": row[1],
+        "species": row[2],
+        "breed": row[3],
+        "age": row[4],
+        "description": row[5],
+        "image": row[6],
+        "center_id": row[7],
+        "center": {
+            "id": row[8],
+            "name": row[9],
+            "location": row[10],
+            "contact": row[11],
+        } if row[8] is not None else None
+    }
+
+def serialize_center_row(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "location": row[2],
+        "contact": row[3],
+        "latitude": row[4],
+        "longitude": row[5],
+    }
+
+def animal_columns(rows):
+    """Animals as column arrays plus each of their centers once, also as columns."""
+    columns = list(zip(*rows)) or [()] * len(ANIMAL_ROW_COLUMNS)
+    centers = {}
+    for row in rows:
+        if row[8] is not None and row[8] not in centers:
+            centers[row[8]] = row[8:12]
+    center_columns = list(zip(*centers.values())) or [()] * 4
+    return {
+        "animals": {field: list(columns[i]) for i, field in enumerate(ANIMAL_FIELDS)},
+        "centers": {field: list(center_columns[i]) for i, field in enumerate(CENTER_FIELDS[:4])},
+    }
+
+def animal_rows_statement():
+    # centers come back in the same query instead of one lookup per animal
+    return select(*ANIMAL_ROW_COLUMNS).outerjoin(CenterModel, AnimalModel.center_id == CenterModel.id)
+
+def centers_statement():
+    return select(*CENTER_ROW_COLUMNS).order_by(CenterModel.id)
+
+def encode_cursor(sort, value, animal_id):
+    """Opaque /animals page cursor: the sort column, and the last row's value and id."""
+    return base64.urlsafe_b64encode(json.dumps([sort.lstrip("-"), value, animal_id]).encode()).decode().rstrip("=")
+
+def page_position(sort, after_id=None, cursor=None):
+    """The (sort value, id) a page starts after, from a cursor or after_id.
+
+    Raises ValueError for a cursor that doesn't decode or was made for a
+    different sort. after_id alone only works when sorting by id, other
+    sorts need the value too, which only the cursor carries.
+    """
+    key = sort.lstrip("-")
+    if cursor is not None:
+        try:
+            cursor_key, value, animal_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        expected = int if key in ("id", "age") else str
+        if cursor_key != key or not isinstance(animal_id, int) or not (value is None or isinstance(value, expected)):
+            raise ValueError(f"This cursor doesn't page sort={sort}")
+        return value, animal_id
+    if after_id is None:
+        return None
+    if key != "id":
+        raise ValueError("after_id only pages sort=id, pass the X-Next-Cursor value as cursor instead")
+    return after_id, after_id
+
+def animals_statement(species, breed, min_age, max_age, center_id, after, limit, sort):
+    """Build the SELECT behind /animals, shared by the sync and async routes.
+
+    `after` is the (sort value, id) from page_position. NULL sort values
+    come first ascending and last descending, SQLite's own order, spelled
+    out so other databases page the same way.
+    """
+    statement = animal_rows_statement()
+
+    if species is not None:
+        statement = statement.where(AnimalModel.species == species)
+    if breed is not None:
+        statement = statement.where(AnimalModel.breed == breed)
+    if min_age is not None:
+        statement = statement.where(AnimalModel.age >= min_age)
+    if max_age is not None:
+        statement = statement.where(AnimalModel.age <= max_age)
+    if center_id is not None:
+        statement = statement.where(AnimalModel.center_id == center_id)
+
+    descending = sort.startswith("-")
+    sort_column = ANIMAL_SORT_COLUMNS[sort.lstrip("-")]
+
+    # keyset pagination: continue after the (sort value, id) of the cursor row
+    if after is not None:
+        value, after_id = after
+        if sort_column is AnimalModel.id:
+            statement = statement.where(AnimalModel.id < after_id if descending else AnimalModel.id > after_id)
+        elif value is None and descending:
+            # nulls come last, only the rest of them are left
+            statement = statement.where(sort_column.is_(None), AnimalModel.id < after_id)
+        elif value is None:
+            statement = statement.where(or_(
+                and_(sort_column.is_(None), AnimalModel.id > after_id),
+                sort_column.is_not(None),
+            ))
+        elif descending:
+            statement = statement.where(or_(
+                sort_column < value,
+                and_(sort_column == value, AnimalModel.id < after_id),
+                sort_column.is_(None),
+            ))
+        else:
+            statement = statement.where(or_(
+                sort_column > value,
+                and_(sort_column == value, AnimalModel.id > after_id),
+            ))
+
+    if sort_column is AnimalModel.id:
+        order = [AnimalModel.id.desc() if descending else AnimalModel.id]
+    elif descending:
+        order = [sort_column.desc().nulls_last(), AnimalModel.id.desc()]
+    else:
+        order = [sort_column.asc().nulls_first(), AnimalModel.id]
+
+    return statement.order_by(*order).limit(limit)
+
+def animal_page(rows, limit, headers, columnar=False, sort="id"):
+    # a full page means there may be more, hand back the cursor for the next one
+    if len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(sort, last[ANIMAL_FIELDS.index(sort.lstrip("-"))], last[0])
+        if sort.lstrip("-") == "id":
+            headers["X-Next-After-Id"] = str(last[0])
+    if columnar:
+        return animal_columns(rows)
+    return [serialize_animal_row(row) for row in rows]
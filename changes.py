@@ -0,0 +1,157 @@
+import logging
+import os
+
+from sqlalchemy import text
+
+from catalog import animal_rows_statement, centers_statement, serialize_animal_row, serialize_center_row
+from models import Animal as AnimalModel, Center as CenterModel
+
+logger = logging.getLogger(__name__)
+
+# Every write to animals and centers appends (version, table, row id, op)
+# to change_log, from the triggers migration 0006 creates on SQLite, so
+# routes, bulk uploads and /sql writes are all covered. op is "upsert",
+# "delete" or "resync": a resync entry means changes before it are gone
+# (compacted away, or never logged, like a bulk load) and clients that
+# haven't seen it yet have to download the catalog again.
+
+SYNCED_TABLES = ("animals", "centers")
+
+# most change_log entries one /changes call reads
+MAX_CHANGES = 5000
+
+# compaction: how often the app runs it, and how long entries are kept
+CHANGES_COMPACT_INTERVAL = float(os.getenv("CHANGES_COMPACT_INTERVAL", "300"))
+CHANGES_RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "7"))
+
+
+def change_log_enabled(db):
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def current_version(db):
+    return db.execute(text("SELECT coalesce(max(version), 0) FROM change_log")).scalar()
+
+
+def log_resync(conn, table="*"):
+    """Log that clients need to download `table` (or everything) again."""
+    conn.execute(
+        text("INSERT INTO change_log (table_name, row_id, op) VALUES (:table, NULL, 'resync')"),
+        {"table": table},
+    )
+
+
+def log_upserts(conn, table, first_id):
+    """Log an upsert for every row from first_id on, for bulk loads that skip the triggers."""
+    conn.execute(
+        text(
+            f"INSERT INTO change_log (table_name, row_id, op)"
+            f" SELECT '{table}', id, 'upsert' FROM {table} WHERE id >= :first_id ORDER BY id"
+        ),
+        {"first_id": first_id},
+    )
+
+
+def reset_change_log(db):
+    # after a reset no old entry is worth sending, every client starts over
+    if change_log_enabled(db):
+        db.execute(text("DELETE FROM change_log"))
+        log_resync(db)
+
+
+def _fetch(db, table, ids):
+    if table == "animals":
+        statement = animal_rows_statement().where(AnimalModel.id.in_(ids))
+        return {row[0]: serialize_animal_row(row) for row in db.execute(statement)}
+    statement = centers_statement().where(CenterModel.id.in_(ids))
+    return {row[0]: serialize_center_row(row) for row in db.execute(statement)}
+
+
+def changes_since(db, since, limit):
+    """Rows changed after version `since`: current values for upserts, ids for deletes.
+
+    Reads at most `limit` log entries; "more" says whether to ask again
+    with the returned version. "resync" means the client is too far behind
+    (or the log isn't kept on this database) and should reload everything,
+    then continue from the returned version.
+    """
+    empty = {table: {"upserts": [], "deletes": []} for table in SYNCED_TABLES}
+    if not change_log_enabled(db):
+        return {"version": 0, "resync": True, "more": False, **empty}
+
+    entries = db.execute(
+        text(
+            "SELECT version, table_name, row_id, op FROM change_log"
+            " WHERE version > :since ORDER BY version LIMIT :limit"
+        ),
+        {"since": since, "limit": limit + 1},
+    ).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    if any(op == "resync" for _, _, _, op in entries):
+        return {"version": current_version(db), "resync": True, "more": False, **empty}
+
+    # only the last thing that happened to a row matters
+    latest = {}
+    for _, table, row_id, op in entries:
+        latest.pop((table, row_id), None)
+        latest[(table, row_id)] = op
+
+    response = {"version": entries[-1][0] if entries else since, "resync": False, "more": more}
+    for table in SYNCED_TABLES:
+        upsert_ids = [row_id for (name, row_id), op in latest.items() if name == table and op == "upsert"]
+        rows = _fetch(db, table, upsert_ids) if upsert_ids else {}
+        response[table] = {
+            "upserts": [rows[row_id] for row_id in upsert_ids if row_id in rows],
+            # deleted since, or by a later change this page didn't reach
+            "deletes": [
+                row_id for (name, row_id), op in latest.items()
+                if name == table and (op == "delete" or row_id not in rows)
+            ],
+        }
+    return response
+
+
+def compact_change_log(conn, retention_days=CHANGES_RETENTION_DAYS):
+    """Drop superseded and expired log entries, return how many went.
+
+    A row's older entries are dropped once it has a newer one. Entries
+    older than the retention period are dropped too, with a resync entry
+    put in their place (reusing the last dropped version) so clients still
+    behind it know to reload.
+    """
+    superseded = conn.execute(text(
+        "DELETE FROM change_log WHERE op != 'resync' AND version < ("
+        "  SELECT max(c.version) FROM change_log c"
+        "  WHERE c.table_name = change_log.table_name AND c.row_id = change_log.row_id"
+        ")"
+    )).rowcount
+    horizon = conn.execute(
+        text("SELECT max(version) FROM change_log WHERE changed_at < datetime('now', :age)"),
+        {"age": f"-{retention_days} days"},
+    ).scalar()
+    expired = 0
+    if horizon is not None:
+        expired = conn.execute(text("DELETE FROM change_log WHERE version <= :horizon"), {"horizon": horizon}).rowcount
+        conn.execute(
+            text("INSERT INTO change_log (version, table_name, row_id, op) VALUES (:horizon, '*', NULL, 'resync')"),
+            {"horizon": horizon},
+        )
+    return superseded + expired
+
+
+def compact_changes():
+    """compact_change_log in its own transaction on the write engine."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if not change_log_enabled(db):
+            return 0
+        removed = compact_change_log(db.connection())
+        db.commit()
+    finally:
+        db.close()
+    if removed:
+        logger.info("compacted the change log, %d entries removed", removed)
+    return removed
@@ -1,14 +1,140 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# reads can go to a replica; by default they share the primary database
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", SQLALCHEMY_DATABASE_URL)
+
+# serve the API routes from an async engine and sessions instead of the
+# sync ones; the sync stack stays in place so the two can be benchmarked
+ASYNC_DB = os.getenv("ASYNC_DB", "").lower() in ("1", "true", "yes")
+
+# PRAGMAs run on every new SQLite connection. "tuned" is WAL with
+# synchronous=NORMAL (readers never block the writer, and commits don't
+# fsync until checkpoint), a busy timeout so writers queue up instead of
+# failing with "database is locked", a page cache (see SQLITE_CACHE_MB)
+# and a 256 MB mmap. The mmap is the OS page cache of the file, shared by
+# every connection, not memory of each one's own. "default" leaves
+# SQLite's own settings alone.
+SQLITE_PROFILES = {
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "default": {},
+}
+
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+
+# the tuned page cache, in MB for all of an engine's connections together:
+# each connection has a private cache, so a fixed size apiece would grow
+# with the pool (64 MB each came to a gigabyte over a full read pool)
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+
+# SQLite's own default cache, no connection gets less
+MIN_CACHE_KIB = 2048
+
+def sqlite_pragmas():
+    # SQLITE_PRAGMAS="cache_size=-16384,mmap_size=0" overrides single values
+    pragmas = dict(SQLITE_PROFILES[SQLITE_PROFILE])
+    for item in os.getenv("SQLITE_PRAGMAS", "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            pragmas[name.strip()] = value.strip()
+    return pragmas
+
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+# connections kept open per pool; SQLite only ever gets a single writer
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def is_file_sqlite(url):
+    return url.startswith("sqlite") and url.split("///", 1)[-1] not in ("", ":memory:")
+
+def use_sqlite_pragmas(engine, extra=None, connections=1):
+    """Apply SQLITE_PRAGMAS (plus extra) to every connection the engine opens.
+
+    connections is how many the engine may hold open at once, the tuned
+    page cache is split between them.
+    """
+    pragmas = {**SQLITE_PRAGMAS, **(extra or {})}
+    if SQLITE_PROFILE == "tuned" and "cache_size" not in pragmas:
+        pragmas["cache_size"] = -max(SQLITE_CACHE_MB * 1024 // connections, MIN_CACHE_KIB)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def sqlite3_connection(dbapi_connection):
+    """The sqlite3 connection behind a pool's DBAPI connection, if there is one."""
+    if hasattr(dbapi_connection, "set_progress_handler"):
+        return dbapi_connection
+    # aiosqlite: the adapter wraps an aiosqlite connection, which wraps sqlite3
+    return getattr(getattr(dbapi_connection, "driver_connection", None), "_conn", None)
+
+def clear_progress_handlers(engine):
+    # SimpleSQL budgets ad-hoc queries with a progress handler; one left
+    # behind by an abandoned stream must not interrupt the next checkout
+    @event.listens_for(engine, "checkin")
+    def clear_progress_handler(dbapi_connection, connection_record):
+        raw = sqlite3_connection(dbapi_connection) if dbapi_connection is not None else None
+        if raw is not None:
+            try:
+                raw.set_progress_handler(None, 0)
+            except Exception:
+                pass  # already closed
+
+def make_engine(url, writer=False, read_only=False):
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url, pool_pre_ping=True, pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+        )
+    if not is_file_sqlite(url):
+        # in-memory databases live and die with their one connection
+        new_engine = create_engine(url, connect_args={"check_same_thread": False})
+        clear_progress_handlers(new_engine)
+        return new_engine
+
+    # SQLite allows one writer at a time, so the write pool holds a single
+    # connection and requests queue for it here rather than on the file lock.
+    # (SQLAlchemy 1.4 would otherwise open a new connection per checkout.)
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=1 if writer else DB_POOL_SIZE,
+        max_overflow=0 if writer else DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    use_sqlite_pragmas(
+        new_engine, {"query_only": "ON"} if read_only else None,
+        connections=1 if writer else DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    )
+    clear_progress_handlers(new_engine)
+    return new_engine
+
+# engine is the write engine; everything that mutates goes through it
+engine = make_engine(SQLALCHEMY_DATABASE_URL, writer=True)
+if SQLALCHEMY_READ_DATABASE_URL.startswith("sqlite") and not is_file_sqlite(SQLALCHEMY_READ_DATABASE_URL):
+    read_engine = engine
+else:
+    read_engine = make_engine(SQLALCHEMY_READ_DATABASE_URL, read_only=True)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -18,3 +144,45 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def async_database_url(url):
+    # same database, async driver: aiosqlite for SQLite, asyncpg for Postgres
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+async_engine = None
+AsyncSessionLocal = None
+
+if ASYNC_DB:
+    # imported here so the async drivers are only needed when turned on
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_url = async_database_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(
+        async_url,
+        connect_args={"check_same_thread": False} if async_url.startswith("sqlite") else {},
+    )
+    if is_file_sqlite(async_url):
+        # no pool, a connection per session: size caches for a full one
+        use_sqlite_pragmas(async_engine.sync_engine, connections=DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    if async_url.startswith("sqlite"):
+        clear_progress_handlers(async_engine.sync_engine)
+    # expire_on_commit off: attributes can't lazy-load after an await
+    AsyncSessionLocal = sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,74 @@
+from sqlalchemy import text
+
+# Catalog facet counts (species, breed, age bucket, center) live in the
+# animal_facets summary table, one row per facet value. Triggers adjust it
+# on every animals write, whichever path it comes from: migration 0005's on
+# SQLite, 0007's on PostgreSQL. Any other database has no triggers and
+# counts from animals on each request.
+
+# labels for the age facet, the triggers bucket ages the same way
+AGE_BUCKETS = "CASE WHEN age IS NULL THEN 'unknown' WHEN age <= 1 THEN '0-1' WHEN age <= 3 THEN '2-3' WHEN age <= 7 THEN '4-7' ELSE '8+' END"
+
+FACET_VALUES = {
+    "species": "coalesce(species, '')",
+    "breed": "coalesce(breed, '')",
+    "age": AGE_BUCKETS,
+    "center_id": "coalesce(CAST(center_id AS TEXT), '')",
+}
+
+FACETS = tuple(FACET_VALUES)
+
+# databases whose migrations keep animal_facets current
+TRIGGER_DIALECTS = ("sqlite", "postgresql")
+
+
+def count_query(where=""):
+    """SQL for (facet, value, count) rows counted from animals."""
+    return " UNION ALL ".join(
+        f"SELECT '{facet}' AS facet, {expression} AS value, count(*) AS count FROM animals {where} GROUP BY 2"
+        for facet, expression in FACET_VALUES.items()
+    )
+
+
+def add_facet_counts(conn, first_id):
+    """Count animals with id >= first_id into the table, for bulk loads that skip the trigger."""
+    # WHERE true tells SQLite's parser the ON CONFLICT belongs to the INSERT
+    conn.execute(
+        text(
+            "INSERT INTO animal_facets (facet, value, count)"
+            f" SELECT facet, value, count FROM ({count_query('WHERE id >= :first_id')}) WHERE true"
+            " ON CONFLICT (facet, value) DO UPDATE SET count = animal_facets.count + excluded.count"
+        ),
+        {"first_id": first_id},
+    )
+
+
+def rebuild_facets(conn):
+    conn.execute(text("DELETE FROM animal_facets"))
+    conn.execute(text(f"INSERT INTO animal_facets (facet, value, count) {count_query()}"))
+
+
+def check_facets(conn):
+    """Compare the table with a fresh count, return (facet, value, stored, actual) mismatches."""
+    stored = {(facet, value): count for facet, value, count in conn.execute(text(
+        "SELECT facet, value, count FROM animal_facets"
+    ))}
+    actual = {(facet, value): count for facet, value, count in conn.execute(text(count_query()))}
+    return sorted(
+        (facet, value, stored.get((facet, value), 0), actual.get((facet, value), 0))
+        for facet, value in stored.keys() | actual.keys()
+        if stored.get((facet, value), 0) != actual.get((facet, value), 0)
+    )
+
+
+def facet_counts(db):
+    """{facet: {value: count}} for the whole catalog, most common values first."""
+    if db.get_bind().dialect.name in TRIGGER_DIALECTS:
+        # one row per facet value, however many animals there are
+        rows = db.execute(text("SELECT facet, value, count FROM animal_facets WHERE count > 0"))
+    else:
+        rows = db.execute(text(count_query()))
+    counts = {facet: {} for facet in FACETS}
+    for facet, value, count in sorted(rows, key=lambda row: (row[0], -row[2], row[1])):
+        counts[facet][value] = count
+    return counts
@@ -0,0 +1,104 @@
+import re
+
+# Offline gazetteer for center locations: "City, State" -> (latitude,
+# longitude) of the city center, WGS84 degrees. It covers every city the
+# sample data and the data generator use plus the larger US cities, so
+# geocoding never needs a network call. Locations not listed here are left
+# without coordinates and don't show up in /centers/nearby.
+CITIES = {
+    "Albuquerque, New Mexico": (35.0844, -106.6504),
+    "Anchorage, Alaska": (61.2181, -149.9003),
+    "Atlanta, Georgia": (33.7490, -84.3880),
+    "Austin, Texas": (30.2672, -97.7431),
+    "Baltimore, Maryland": (39.2904, -76.6122),
+    "Baton Rouge, Louisiana": (30.4515, -91.1871),
+    "Billings, Montana": (45.7833, -108.5007),
+    "Birmingham, Alabama": (33.5186, -86.8104),
+    "Boise, Idaho": (43.6150, -116.2023),
+    "Boston, Massachusetts": (42.3601, -71.0589),
+    "Boulder, Colorado": (40.0150, -105.2705),
+    "Buffalo, New York": (42.8864, -78.8784),
+    "Burlington, Vermont": (44.4759, -73.2121),
+    "Charleston, South Carolina": (32.7765, -79.9311),
+    "Charleston, West Virginia": (38.3498, -81.6326),
+    "Charlotte, North Carolina": (35.2271, -80.8431),
+    "Cheyenne, Wyoming": (41.1400, -104.8202),
+    "Chicago, Illinois": (41.8781, -87.6298),
+    "Cincinnati, Ohio": (39.1031, -84.5120),
+    "Cleveland, Ohio": (41.4993, -81.6944),
+    "Colorado Springs, Colorado": (38.8339, -104.8214),
+    "Columbia, South Carolina": (34.0007, -81.0348),
+    "Columbus, Ohio": (39.9612, -82.9988),
+    "Dallas, Texas": (32.7767, -96.7970),
+    "Denver, Colorado": (39.7392, -104.9903),
+    "Des Moines, Iowa": (41.5868, -93.6250),
+    "Detroit, Michigan": (42.3314, -83.0458),
+    "El Paso, Texas": (31.7619, -106.4850),
+    "Eugene, Oregon": (44.0521, -123.0868),
+    "Fargo, North Dakota": (46.8772, -96.7898),
+    "Fort Worth, Texas": (32.7555, -97.3308),
+    "Fresno, California": (36.7378, -119.7871),
+    "Hartford, Connecticut": (41.7658, -72.6734),
+    "Honolulu, Hawaii": (21.3069, -157.8583),
+    "Houston, Texas": (29.7604, -95.3698),
+    "Indianapolis, Indiana": (39.7684, -86.1581),
+    "Jackson, Mississippi": (32.2988, -90.1848),
+    "Jacksonville, Florida": (30.3322, -81.6557),
+    "Kansas City, Missouri": (39.0997, -94.5786),
+    "Las Vegas, Nevada": (36.1699, -115.1398),
+    "Little Rock, Arkansas": (34.7465, -92.2896),
+    "Los Angeles, California": (34.0522, -118.2437),
+    "Louisville, Kentucky": (38.2527, -85.7585),
+    "Madison, Wisconsin": (43.0731, -89.4012),
+    "Manchester, New Hampshire": (42.9956, -71.4548),
+    "Memphis, Tennessee": (35.1495, -90.0490),
+    "Miami, Florida": (25.7617, -80.1918),
+    "Milwaukee, Wisconsin": (43.0389, -87.9065),
+    "Minneapolis, Minnesota": (44.9778, -93.2650),
+    "Nashville, Tennessee": (36.1627, -86.7816),
+    "New Orleans, Louisiana": (29.9511, -90.0715),
+    "New York, New York": (40.7128, -74.0060),
+    "Newark, New Jersey": (40.7357, -74.1724),
+    "Oakland, California": (37.8044, -122.2712),
+    "Oklahoma City, Oklahoma": (35.4676, -97.5164),
+    "Omaha, Nebraska": (41.2565, -95.9345),
+    "Orlando, Florida": (28.5383, -81.3792),
+    "Philadelphia, Pennsylvania": (39.9526, -75.1652),
+    "Phoenix, Arizona": (33.4484, -112.0740),
+    "Pittsburgh, Pennsylvania": (40.4406, -79.9959),
+    "Portland, Maine": (43.6591, -70.2568),
+    "Portland, Oregon": (45.5152, -122.6784),
+    "Providence, Rhode Island": (41.8240, -71.4128),
+    "Raleigh, North Carolina": (35.7796, -78.6382),
+    "Reno, Nevada": (39.5296, -119.8138),
+    "Richmond, Virginia": (37.5407, -77.4360),
+    "Sacramento, California": (38.5816, -121.4944),
+    "Salt Lake City, Utah": (40.7608, -111.8910),
+    "San Antonio, Texas": (29.4241, -98.4936),
+    "San Diego, California": (32.7157, -117.1611),
+    "San Francisco, California": (37.7749, -122.4194),
+    "San Jose, California": (37.3382, -121.8863),
+    "Seattle, Washington": (47.6062, -122.3321),
+    "Sioux Falls, South Dakota": (43.5446, -96.7311),
+    "Spokane, Washington": (47.6588, -117.4260),
+    "St. Louis, Missouri": (38.6270, -90.1994),
+    "Tacoma, Washington": (47.2529, -122.4443),
+    "Tampa, Florida": (27.9506, -82.4572),
+    "Tucson, Arizona": (32.2226, -110.9747),
+    "Tulsa, Oklahoma": (36.1540, -95.9928),
+    "Washington, District of Columbia": (38.9072, -77.0369),
+    "Wichita, Kansas": (37.6872, -97.3301),
+    "Wilmington, Delaware": (39.7391, -75.5398),
+}
+
+def normalize(location):
+    # case, spacing and punctuation around the comma don't matter
+    return re.sub(r"\s*,\s*", ", ", re.sub(r"\s+", " ", location.strip())).lower()
+
+_BY_NAME = {normalize(name): coordinates for name, coordinates in CITIES.items()}
+
+def coordinates(location):
+    """Return (latitude, longitude) for a "City, State" location, or (None, None)."""
+    if not location:
+        return None, None
+    return _BY_NAME.get(normalize(location), (None, None))
@@ -0,0 +1,131 @@
+import math
+
+from sqlalchemy import func, or_, select, text
+
+from models import Animal as AnimalModel, Center as CenterModel
+
+# Radius queries go through the centers_rtree R*Tree that migration 0003
+# creates on SQLite, kept up to date by triggers on centers. The index
+# narrows the search to a bounding box; exact distances are then computed
+# here for the few centers inside it.
+
+EARTH_RADIUS_KM = 6371.0088
+
+# largest radius /centers/nearby accepts
+MAX_RADIUS_KM = 2000
+
+# centers whose animals are counted per query while filling a page
+COUNT_BATCH = 200
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance between two points, in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return (min_lat, max_lat, lon_ranges) covering the circle.
+
+    lon_ranges has two ranges when the box crosses the antimeridian, and
+    spans every longitude when it reaches a pole.
+    """
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - lat_delta, lat + lat_delta
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    # widest longitude offset of the circle, at the latitude where it
+    # touches its bounding meridians
+    lon_delta = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - lon_delta, lon + lon_delta
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def centers_in_box(db, min_lat, max_lat, lon_ranges):
+    """Return (id, name, location, contact, latitude, longitude) rows inside the box."""
+    if db.get_bind().dialect.name == "sqlite":
+        params = {"min_lat": min_lat, "max_lat": max_lat}
+        lon_conditions = []
+        for i, (min_lon, max_lon) in enumerate(lon_ranges):
+            params[f"min_lon{i}"], params[f"max_lon{i}"] = min_lon, max_lon
+            lon_conditions.append(f"(r.max_lon >= :min_lon{i} AND r.min_lon <= :max_lon{i})")
+        return db.execute(
+            text(
+                "SELECT c.id, c.name, c.location, c.contact, c.latitude, c.longitude"
+                " FROM centers_rtree r JOIN centers c ON c.id = r.id"
+                " WHERE r.max_lat >= :min_lat AND r.min_lat <= :max_lat"
+                f" AND ({' OR '.join(lon_conditions)})"
+            ),
+            params,
+        ).all()
+
+    # no R*Tree elsewhere: the same box on the plain columns
+    return db.execute(
+        select(
+            CenterModel.id, CenterModel.name, CenterModel.location,
+            CenterModel.contact, CenterModel.latitude, CenterModel.longitude,
+        ).where(
+            CenterModel.latitude.between(min_lat, max_lat),
+            or_(*(CenterModel.longitude.between(min_lon, max_lon) for min_lon, max_lon in lon_ranges)),
+        )
+    ).all()
+
+
+def animal_counts(db, center_ids, species):
+    statement = (
+        select(AnimalModel.center_id, func.count())
+        .where(AnimalModel.center_id.in_(center_ids))
+        .group_by(AnimalModel.center_id)
+    )
+    if species is not None:
+        statement = statement.where(AnimalModel.species == species)
+    return dict(db.execute(statement).all())
+
+
+def nearby_centers_page(db, lat, lon, radius_km, species, limit):
+    """Centers within radius_km of (lat, lon), nearest first.
+
+    Each one comes with its distance and how many animals it has (of the
+    given species, if any). With a species, centers without one are
+    skipped; animals are counted in batches, nearest centers first, until
+    the page is full.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    candidates = []
+    for row in centers_in_box(db, min_lat, max_lat, lon_ranges):
+        distance = distance_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            candidates.append((distance, row))
+    candidates.sort(key=lambda candidate: (candidate[0], candidate[1].id))
+
+    page = []
+    batch = limit if species is None else max(limit, COUNT_BATCH)
+    for start in range(0, len(candidates), batch):
+        chunk = candidates[start:start + batch]
+        counts = animal_counts(db, [row.id for _, row in chunk], species)
+        for distance, row in chunk:
+            animals = counts.get(row.id, 0)
+            if species is not None and not animals:
+                continue
+            page.append({
+                "id": row.id,
+                "name": row.name,
+                "location": row.location,
+                "contact": row.contact,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "distance_km": round(distance, 2),
+                "animals": animals,
+            })
+            if len(page) == limit:
+                return page
+    return page
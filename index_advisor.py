@@ -0,0 +1,364 @@
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+
+from sql_parser import parse, tokenize
+
+logger = logging.getLogger(__name__)
+
+# SimpleSQL hands every SELECT it runs to query_stats, which groups them by
+# shape (the SQL with literals and parameters replaced by ?), adds up their
+# run time and keeps one sample of each. Recording is a dict update; the
+# query plans are only read (EXPLAIN QUERY PLAN) when SHOW INDEX ADVICE
+# asks, which lists the shapes whose plan scans a whole table or sorts in a
+# temp B-tree, most total time first, with an index that would avoid it.
+# Stats are kept per process, from its start or the last SHOW INDEX ADVICE
+# RESET.
+
+# shapes tracked at most; past that the one with the least total time goes
+MAX_SHAPES = int(os.getenv("SQL_ADVISOR_SHAPES", "500"))
+
+# covering a query is only worth it while the index stays narrow
+MAX_INDEX_COLUMNS = 6
+
+EQUALITY_OPERATORS = {"=", "IN", "IS"}
+# LIKE and GLOB are left out, SQLite only uses an index for them in
+# special cases (a prefix pattern and a matching collation)
+RANGE_OPERATORS = {"<", ">", "BETWEEN"}
+
+# keywords that start the clause a column reference sits in
+CLAUSES = {
+    "SELECT": "select", "FROM": "from", "JOIN": "from", "ON": "where", "WHERE": "where",
+    "GROUP": "sort", "ORDER": "sort", "HAVING": "other", "LIMIT": "other", "OFFSET": "other",
+    "UNION": "other", "EXCEPT": "other", "INTERSECT": "other",
+}
+
+# words that can follow a table name without being its alias
+NOT_ALIASES = set(CLAUSES) | {"AS", "LEFT", "RIGHT", "INNER", "CROSS", "OUTER", "NATURAL", "USING", "INDEXED", "NOT"}
+
+
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN details for a query, or None if it can't be explained."""
+    try:
+        # EXPLAIN doesn't check the schema is current and the driver reuses
+        # its prepared statement for the same text, so a plan from before a
+        # new index would keep coming back. Reading the version through a
+        # SELECT reloads the schema, and putting it in the SQL re-plans.
+        version = conn.execute(text("SELECT schema_version FROM pragma_schema_version")).scalar()
+        clause = parse(sql)[0].clause
+        plan = text(f"EXPLAIN QUERY PLAN {clause.text} -- schema {version}")
+        return [row[3] for row in conn.execute(plan, params or {})]
+    except Exception:
+        logger.debug("couldn't explain %s", sql, exc_info=True)
+        return None
+
+
+def plan_problems(plan):
+    """Full table scans and temp B-tree sorts among EXPLAIN QUERY PLAN details."""
+    problems = []
+    for detail in plan:
+        # "SCAN table", even through an index, reads all of it; only a
+        # SEARCH narrows it down. Subqueries, constant rows and virtual
+        # tables (FTS, R*Tree) aren't for us to index
+        if (
+            detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail
+            and "CONSTANT ROW" not in detail and not detail.startswith("SCAN (")
+        ):
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append(detail)
+    return problems
+
+
+def _words(sql):
+    return [(kind, value) for kind, value in tokenize(sql) if kind not in ("space", "comment")]
+
+
+def _unquote(name):
+    return name.strip('"`[]')
+
+
+def table_names(sql):
+    """{name or alias (lowercase): table} for the tables in FROM / JOIN clauses."""
+    words = _words(sql)
+    names = {}
+    for i, (_, value) in enumerate(words[:-1]):
+        if value.upper() not in ("FROM", "JOIN") or words[i + 1][0] not in ("word", "quoted"):
+            continue
+        table = _unquote(words[i + 1][1])
+        names[table.lower()] = table
+        rest = words[i + 2:i + 4]
+        if rest and rest[0][1].upper() == "AS":
+            rest = rest[1:]
+        if rest and rest[0][0] in ("word", "quoted") and rest[0][1].upper() not in NOT_ALIASES:
+            names[_unquote(rest[0][1]).lower()] = table
+    return names
+
+
+def first_table(sql):
+    words = _words(sql)
+    for i, (_, value) in enumerate(words[:-1]):
+        if value.upper() == "FROM" and words[i + 1][0] in ("word", "quoted"):
+            return _unquote(words[i + 1][1])
+    return None
+
+
+def _or_groups(words):
+    """Where each word sits and which parenthesised groups hold a bare OR.
+
+    Returns (enclosing, groups): enclosing[i] is the tuple of open
+    parenthesis positions around word i, groups the set of those positions
+    (None for the top level) that an OR appears directly inside.
+    """
+    stack = []
+    enclosing = []
+    groups = set()
+    for i, (_, value) in enumerate(words):
+        enclosing.append(tuple(stack))
+        if value == "(":
+            stack.append(i)
+        elif value == ")" and stack:
+            stack.pop()
+        elif value.upper() == "OR":
+            groups.add(stack[-1] if stack else None)
+    return enclosing, groups
+
+
+def column_references(sql, table, columns):
+    """Sort the columns of `table` a query mentions by how it uses them.
+
+    A token-level heuristic rather than a parser: "equality" and "range"
+    are columns compared in WHERE / ON, "sort" the ones in ORDER BY /
+    GROUP BY (in order), "other" everything else, and "star" says whether
+    the select list has a bare *, which no index can cover. When the WHERE
+    clause is an OR, "disjuncts" holds the equality and range columns of
+    each of its branches instead; columns compared inside a nested OR are
+    only counted as "other", no one index serves both sides.
+    """
+    words = _words(sql)
+    names = {name for name, target in table_names(sql).items() if target.lower() == table.lower()}
+    enclosing, or_groups = _or_groups(words)
+    found = {"equality": [], "range": [], "sort": [], "other": [], "star": False, "disjuncts": []}
+    clause = None
+    # the WHERE clause's depth, and its branch while it's a top-level OR
+    where_depth = None
+    disjunct = None
+    for i, (kind, value) in enumerate(words):
+        if kind == "word" and value.upper() in CLAUSES:
+            clause = CLAUSES[value.upper()]
+            if value.upper() == "WHERE":
+                where_depth = enclosing[i]
+                top = where_depth[-1] if where_depth else None
+                disjunct = None
+                if top in or_groups:
+                    found["disjuncts"].append({"equality": [], "range": []})
+                    disjunct = found["disjuncts"][-1]
+            continue
+        if disjunct is not None and clause == "where" and value.upper() == "OR" and enclosing[i] == where_depth:
+            found["disjuncts"].append({"equality": [], "range": []})
+            disjunct = found["disjuncts"][-1]
+            continue
+        if value == "*" and clause == "select" and words[i - 1][1] != "(":
+            found["star"] = True
+            continue
+        column = _unquote(value).lower()
+        if kind not in ("word", "quoted") or column not in columns:
+            continue
+        previous = words[i - 1][1] if i else ""
+        following = words[i + 1][1].upper() if i + 1 < len(words) else ""
+        if following == "." or previous.upper() == "AS":
+            continue  # a table name, or an output alias
+        if previous == "." and _unquote(words[i - 2][1]).lower() not in names:
+            continue  # another table's column
+        nested_or = clause == "where" and any(group in or_groups for group in enclosing[i][len(where_depth or ()):])
+        if clause == "where" and not nested_or and (following in EQUALITY_OPERATORS or previous == "="):
+            use = "equality"
+        elif clause == "where" and not nested_or and following in RANGE_OPERATORS:
+            use = "range"
+        elif clause == "sort":
+            use = "sort"
+        else:
+            use = "other"
+        target = disjunct if disjunct is not None and clause == "where" and use in ("equality", "range") else found
+        if column not in target[use]:
+            target[use].append(column)
+        if target is disjunct and column not in found["other"]:
+            found["other"].append(column)
+    return found
+
+
+def propose_indexes(references, sort_problem):
+    """Column lists for the indexes serving the query, empty if there's nothing to key them on."""
+    if references["disjuncts"]:
+        # SQLite answers an OR with one index per branch, or scans: every
+        # branch needs its own index
+        proposals = []
+        for branch in references["disjuncts"]:
+            keys = [column for column in branch["equality"] if column != "id"]
+            keys += [column for column in branch["range"][:1] if column not in keys]
+            if not keys and "id" in branch["equality"]:
+                continue  # a rowid lookup
+            if not keys:
+                return []
+            if keys not in proposals:
+                proposals.append(keys)
+        return proposals
+    # id is the rowid, looking it up needs no index
+    keys = [column for column in references["equality"] if column != "id"]
+    if sort_problem and references["sort"]:
+        keys += [column for column in references["sort"] if column not in keys]
+    elif references["range"]:
+        keys += [column for column in references["range"][:1] if column not in keys]
+    if not keys:
+        return []
+    if not references["star"]:
+        # the rest of what the query reads, so it never has to visit the table
+        extra = [
+            column for use in ("range", "sort", "other") for column in references[use]
+            if column not in keys and column != "id"
+        ]
+        extra = list(dict.fromkeys(extra))
+        if len(keys) + len(extra) <= MAX_INDEX_COLUMNS:
+            keys += extra
+    return [keys]
+
+
+def existing_indexes(conn, table):
+    """Column lists of the indexes on a table."""
+    indexes = []
+    for row in conn.execute(text(f'PRAGMA index_list("{table}")')).all():
+        columns = [info[2] for info in conn.execute(text(f'PRAGMA index_info("{row[1]}")'))]
+        indexes.append([column.lower() for column in columns if column])
+    return indexes
+
+
+def suggest_indexes(conn, sql, problems, schema):
+    """(table, columns) for the indexes that would fix a query's problem plan.
+
+    Names come back lowercase, SQLite matches them case-insensitively.
+    `schema` caches (columns, indexes) per table across calls.
+    """
+    names = table_names(sql)
+    scanned = [detail.split()[1] for detail in problems if detail.startswith("SCAN ")]
+    sort_problem = any(detail.startswith("USE TEMP B-TREE") for detail in problems)
+    if sort_problem and not scanned:
+        # the sort belongs to the query's first table
+        scanned = [first_table(sql)]
+
+    suggestions = []
+    for name in dict.fromkeys(scanned):
+        table = names.get((name or "").lower())
+        if table is None:
+            continue
+        table = table.lower()
+        if table not in schema:
+            columns = {row[1].lower() for row in conn.execute(text(f'PRAGMA table_info("{table}")'))}
+            schema[table] = (columns, existing_indexes(conn, table) if columns else [])
+        columns, indexes = schema[table]
+        if not columns:
+            continue  # a CTE or view
+        for keys in propose_indexes(column_references(sql, table, columns), sort_problem):
+            if any(index[:len(keys)] == keys for index in indexes):
+                continue
+            suggestions.append((table, keys))
+    return suggestions
+
+
+def drop_prefixes(suggestions):
+    """The suggestions that aren't a leading part of another one on the same
+    table: an index on (a, b) serves every query one on (a) would."""
+    return [
+        (table, keys) for i, (table, keys) in enumerate(suggestions)
+        if not any(
+            other_table == table and other[:len(keys)] == keys and (len(other) > len(keys) or j < i)
+            for j, (other_table, other) in enumerate(suggestions) if j != i
+        )
+    ]
+
+
+def index_name(table, keys):
+    return f"ix_{table}_{'_'.join(keys)}"
+
+
+def create_index(table, keys):
+    return f"CREATE INDEX IF NOT EXISTS {index_name(table, keys)} ON {table} ({', '.join(keys)})"
+
+
+class QueryStats:
+    """Call counts, run time and a sample of every SELECT shape seen."""
+
+    def __init__(self, max_shapes=MAX_SHAPES):
+        self.max_shapes = max_shapes
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._shapes)
+
+    def observe(self, statement, params, elapsed):
+        """Count one run of a parsed SELECT statement."""
+        with self._lock:
+            entry = self._shapes.get(statement.shape)
+            if entry is not None:
+                entry["calls"] += 1
+                entry["total"] += elapsed
+                return
+            if len(self._shapes) >= self.max_shapes:
+                cheapest = min(self._shapes, key=lambda key: self._shapes[key]["total"])
+                del self._shapes[cheapest]
+            self._shapes[statement.shape] = {"sql": statement.sql, "params": params, "calls": 1, "total": elapsed}
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+    def advice(self, conn):
+        """Rows for the shapes with a full scan or temp B-tree sort, most total
+        time first, and the CREATE INDEX statements they suggest, leaving out
+        any whose columns lead another suggestion's.
+
+        Shapes are explained here, against the current schema, so indexes
+        created since a query ran are taken into account.
+        """
+        with self._lock:
+            shapes = list(self._shapes.items())
+        schema = {}
+        rows = []
+        suggested = []
+        for shape, entry in shapes:
+            plan = explain(conn, entry["sql"], entry["params"])
+            if plan is None:
+                continue
+            problems = plan_problems(plan)
+            if not problems:
+                continue
+            suggestions = suggest_indexes(conn, entry["sql"], problems, schema)
+            suggested += suggestions
+            rows.append(({
+                "calls": entry["calls"],
+                "total_ms": round(entry["total"] * 1000, 1),
+                "avg_ms": round(entry["total"] * 1000 / entry["calls"], 2),
+                "problems": "; ".join(problems),
+                "suggestion": None,
+                "query": shape,
+            }, suggestions))
+
+        # each shape points at the index that will actually be created for it,
+        # which may be a wider one another shape asked for
+        kept = drop_prefixes(suggested)
+        for row, suggestions in rows:
+            covering = []
+            for table, keys in suggestions:
+                index = next((other, wider) for other, wider in kept if other == table and wider[:len(keys)] == keys)
+                if create_index(*index) not in covering:
+                    covering.append(create_index(*index))
+            row["suggestion"] = "; ".join(covering) or None
+        rows = sorted((row for row, _ in rows), key=lambda row: row["total_ms"], reverse=True)
+        statements = [create_index(table, keys) for table, keys in kept]
+        return [{"rank": rank, **row} for rank, row in enumerate(rows, 1)], statements
+
+
+query_stats = QueryStats()
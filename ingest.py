@@ -0,0 +1,272 @@
+import codecs
+import csv
+import json
+
+from pydantic import ValidationError
+from sqlalchemy import func, select, text
+
+from changes import log_resync, log_upserts
+from database import sqlite3_connection
+from facets import add_facet_counts
+from models import Animal as AnimalModel
+from schemas import AnimalCreate
+
+# rows per transaction when bulk loading
+CHUNK_SIZE = 5000
+
+# only the first few row errors are reported back, the rest are counted
+MAX_REPORTED_ERRORS = 100
+
+# per-row AFTER INSERT triggers on animals (SQLite): FTS, facet counts and
+# the change log. A bulk insert drops them and catches up once, set-based.
+ANIMAL_INSERT_TRIGGERS = ("animals_fts_insert", "animal_facets_insert", "change_log_animals_insert")
+
+
+async def iter_lines(byte_stream):
+    """Yield decoded lines from an async stream of byte chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in byte_stream:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_ndjson_records(byte_stream):
+    """Yield (row number, record) pairs, record is a dict or the parse error."""
+    row = 0
+    async for line in iter_lines(byte_stream):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = f"invalid JSON: {e}"
+        else:
+            if not isinstance(record, dict):
+                record = "expected a JSON object"
+        yield row, record
+
+
+async def iter_csv_records(byte_stream):
+    """Yield (row number, record) pairs from CSV with a header line.
+
+    A quoted field may span lines, so lines are gathered until the quotes
+    balance before handing the record to the csv module.
+    """
+    header = None
+    row = 0
+    record_text = ""
+    async for line in iter_lines(byte_stream):
+        record_text = f"{record_text}\n{line}" if record_text else line
+        if record_text.count('"') % 2:
+            continue  # still inside a quoted field
+        text, record_text = record_text, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"expected {len(header)} fields, got {len(values)}"
+            continue
+        yield row, dict(zip(header, values))
+    if record_text:
+        yield row + 1, "unterminated quoted field"
+
+
+def _format_validation_error(error):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+STR_FIELDS = ("name", "species", "breed", "description")
+INT_FIELDS = ("age", "center_id")
+
+
+def _fast_animal(record):
+    # records that already carry the right types (or plain digit strings, as
+    # CSV gives us) need no real validation, so skip building a pydantic
+    # model for them; anything else goes through AnimalCreate
+    values = {}
+    for field in STR_FIELDS:
+        value = record.get(field)
+        if type(value) is not str:
+            return None
+        values[field] = value
+    for field in INT_FIELDS:
+        value = record.get(field)
+        if type(value) is str and value.isascii() and value.isdigit():
+            value = int(value)
+        elif type(value) is not int:
+            return None
+        values[field] = value
+    image = record.get("image")
+    if image is not None and type(image) is not str:
+        return None
+    values["image"] = image
+    return values
+
+
+def validate_animals(records):
+    """Split (row, record) pairs into insertable rows and (row, error) pairs."""
+    rows = []
+    errors = []
+    for row, record in records:
+        if isinstance(record, str):
+            errors.append((row, record))
+            continue
+        values = _fast_animal(record)
+        if values is None:
+            try:
+                values = AnimalCreate(**record).dict()
+            except ValidationError as e:
+                errors.append((row, _format_validation_error(e)))
+                continue
+        if not values.get("image"):
+            values["image"] = f"https://picsum.photos/400/300?random={values['center_id']}"
+        rows.append((row, values))
+    return rows, errors
+
+
+def begin_transaction(conn):
+    """Open the SQLite transaction now, so DDL that follows is part of it."""
+    raw = sqlite3_connection(conn.connection.dbapi_connection)
+    if raw is None or not raw.in_transaction:
+        conn.exec_driver_sql("BEGIN")
+
+
+def suspend_insert_triggers(conn):
+    """Drop the animals insert triggers, returning their DDL for restore_insert_triggers."""
+    names = ", ".join(f"'{name}'" for name in ANIMAL_INSERT_TRIGGERS)
+    saved = conn.execute(text(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({names})"
+    )).all()
+    for name, _ in saved:
+        conn.execute(text(f'DROP TRIGGER "{name}"'))
+    return dict(saved)
+
+
+def restore_insert_triggers(conn, saved, first_id, resync=False):
+    """Recreate the triggers and do their work for animals with id >= first_id.
+
+    resync logs one "reload animals" entry instead of an upsert per row.
+    """
+    for statement in saved.values():
+        conn.execute(text(statement))
+    if "animals_fts_insert" in saved:
+        conn.execute(
+            text(
+                "INSERT INTO animals_fts(rowid, name, breed, species, description)"
+                " SELECT id, name, breed, species, description FROM animals WHERE id >= :first_id"
+            ),
+            {"first_id": first_id},
+        )
+    if "animal_facets_insert" in saved:
+        add_facet_counts(conn, first_id)
+    if "change_log_animals_insert" in saved:
+        if resync:
+            log_resync(conn, "animals")
+        else:
+            log_upserts(conn, "animals", first_id)
+
+
+def insert_animals(db, rows):
+    """Insert validated rows in one transaction with a single executemany.
+
+    If the batch is rejected the rows are retried one by one so a single bad
+    row only costs itself. Returns (inserted count, [(row, error), ...]).
+    """
+    if not rows:
+        return 0, []
+    table = AnimalModel.__table__
+    try:
+        if db.get_bind().dialect.name == "sqlite":
+            # the triggers come back in the same transaction, so no other
+            # writer ever sees animals without them and a failed batch's
+            # rollback restores them; pysqlite only opens a transaction
+            # before DML, so a DROP TRIGGER would commit on its own
+            conn = db.connection()
+            begin_transaction(conn)
+            first_id = conn.execute(select(func.coalesce(func.max(AnimalModel.id), 0) + 1)).scalar()
+            saved = suspend_insert_triggers(conn)
+            conn.execute(table.insert(), [values for _, values in rows])
+            restore_insert_triggers(conn, saved, first_id)
+        else:
+            db.execute(table.insert(), [values for _, values in rows])
+        db.commit()
+        return len(rows), []
+    except Exception:
+        db.rollback()
+
+    inserted = 0
+    errors = []
+    for row, values in rows:
+        try:
+            db.execute(table.insert(), values)
+            db.commit()
+            inserted += 1
+        except Exception as e:
+            db.rollback()
+            errors.append((row, str(e.orig) if hasattr(e, "orig") else str(e)))
+    return inserted, errors
+
+
+def load_animal_chunk(db, records):
+    """Validate and insert one chunk of (row, record) pairs."""
+    rows, errors = validate_animals(records)
+    inserted, insert_errors = insert_animals(db, rows)
+    return inserted, errors + insert_errors
+
+
+def upload_records(request, fmt=None):
+    """Pick the record parser for an upload from ?format or its content type."""
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if fmt == "csv":
+        return iter_csv_records(request.stream())
+    return iter_ndjson_records(request.stream())
+
+
+async def ingest_animals(records, load_chunk, on_insert=None):
+    """Feed (row, record) pairs to load_chunk CHUNK_SIZE at a time.
+
+    The upload is parsed as it streams in, and bad rows are reported
+    without failing the rest. load_chunk is an async callable returning
+    (inserted, errors); on_insert runs after every chunk that added rows.
+    """
+    inserted = 0
+    errors = []
+
+    async def flush(chunk):
+        nonlocal inserted
+        chunk_inserted, chunk_errors = await load_chunk(chunk)
+        inserted += chunk_inserted
+        errors.extend(chunk_errors)
+        if chunk_inserted and on_insert is not None:
+            on_insert()
+
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= CHUNK_SIZE:
+            await flush(chunk)
+            chunk = []
+    if chunk:
+        await flush(chunk)
+
+    return {
+        "message": f"Loaded {inserted} animal(s)",
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": [{"row": row, "error": error} for row, error in errors[:MAX_REPORTED_ERRORS]],
+    }
@@ -1,36 +1,92 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from models import User, Animal as AnimalModel, Center as CenterModel, Adoption
 from schemas import UserCreate, UserLogin, Animal, Center, AdoptionCreate, AnimalCreate, AnimalUpdate
-from sample_data import create_sample_data
-from database import SessionLocal, engine, get_db, Base
+from sample_data import MAX_GENERATED_ROWS, create_sample_data, generate_sample_data
+from database import ASYNC_DB, SessionLocal, async_engine, engine, read_engine, get_db, get_read_db
 from sql_engine import SimpleSQL
-import hashlib
+from sql_http import read_sql_request, run_sql_request
+from cache import response_cache, cached_response
+from security import check_password, hash_password, hash_pool, reject_unknown_user
+from accounts import insert_user_statement, registration_conflict
+from serialization import FastJSONResponse
+from catalog import animal_page, animals_statement, page_position, centers_statement, serialize_center_row
+import metrics
+from search import search_animals_page
+from facets import facet_counts
+from changes import CHANGES_COMPACT_INTERVAL, MAX_CHANGES, changes_since, compact_changes, reset_change_log
+from geo import MAX_RADIUS_KM, nearby_centers_page
+from ingest import ingest_animals, load_animal_chunk, upload_records
+from admission import ADMISSION_CONTROL, AdmissionMiddleware
+from adoption_queue import WRITE_BEHIND_ADOPTIONS, QueueFull, accepted_response, adoption_queue, queue_full_error
+from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
 
-Base.metadata.create_all(bind=engine)
+metrics.instrument_engine(engine)
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine)
 
-# Create sample data
-db = SessionLocal()
-create_sample_data(db)
-db.close()
+# schema changes and sample data are deployment steps (python manage.py
+# migrate --seed) run once, not by every worker on import; AUTO_MIGRATE=1
+# does them at startup instead, handy for a single local process
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "").lower() in ("1", "true", "yes")
+SEED_SAMPLE_DATA = os.getenv("SEED_SAMPLE_DATA", "").lower() in ("1", "true", "yes")
 
-app = FastAPI()
+async def compact_changes_periodically(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(compact_changes)
+        except Exception:
+            logging.getLogger(__name__).exception("change log compaction failed")
 
+@asynccontextmanager
+async def lifespan(app):
+    if AUTO_MIGRATE:
+        from manage import migrate
+        await run_in_threadpool(migrate, seed=SEED_SAMPLE_DATA)
+    compaction = None
+    if CHANGES_COMPACT_INTERVAL > 0:
+        compaction = asyncio.create_task(compact_changes_periodically(CHANGES_COMPACT_INTERVAL))
+    yield
+    if compaction is not None:
+        compaction.cancel()
+    # acknowledged adoption requests go to the database before it closes
+    await run_in_threadpool(adoption_queue.close)
+    hash_pool.shutdown()
+    engine.dispose()
+    read_engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+if ADMISSION_CONTROL:
+    # inside CORS, so rejections still carry the CORS headers
+    app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "X-Next-Cursor", "X-Search-Candidate-Limit"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-# password hashing 
-def get_password_hash(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(plain_password, hashed_password):
-    return get_password_hash(plain_password) == hashed_password
+if ASYNC_DB:
+    # registered before the sync routes below, so these are the ones matched
+    import async_routes
+    app.include_router(async_routes.router)
+    metrics.instrument_engine(async_engine.sync_engine)
 
 def get_db():
     db = SessionLocal()
@@ -41,70 +97,134 @@ def get_db():
 
 @app.post("/register")
 def register(user: UserCreate, db: Session = Depends(get_db)):
-    # make sure username isn't taken
-    existing_user = db.query(User).filter(User.username == user.username).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username already taken")
-
-    
-    existing_email = db.query(User).filter(User.email == user.email).first()
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already in use")
-
-    # create new user
-    hashed_password = get_password_hash(user.password)
-    new_user = User(username=user.username, email=user.email, password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # create new user (bcrypt runs in the hash worker processes); the unique
+    # indexes reject a taken username or email, no need to look first
+    hashed_password = hash_password(user.password)
+    try:
+        db.execute(insert_user_statement(user.username, user.email, hashed_password))
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        detail = registration_conflict(e)
+        if detail is None:
+            raise
+        raise HTTPException(status_code=400, detail=detail)
     return {"message": "Account created successfully"}
 
 @app.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
+def login(user: UserLogin, db: Session = Depends(get_read_db), write_db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password):
+    if not db_user:
+        reject_unknown_user()
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    valid, new_hash = check_password(user.password, db_user.password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # legacy SHA-256 hash (or an old cost factor), store the bcrypt one
+        write_db.query(User).filter(User.id == db_user.id, User.password == db_user.password).update(
+            {"password": new_hash}, synchronize_session=False
+        )
+        write_db.commit()
     return {"message": "Login successful", "user_id": db_user.id}
 
+def list_animals(db, headers, species, breed, min_age, max_age, center_id, after, limit, sort, columnar=False):
+    statement = animals_statement(species, breed, min_age, max_age, center_id, after, limit, sort)
+    return animal_page(db.execute(statement).all(), limit, headers, columnar, sort)
+
 @app.get("/animals")
-def get_animals(db: Session = Depends(get_db)):
-    animals = db.query(AnimalModel).all()
-    result = []
-    # build response with center info included
-    for animal in animals:
-        animal_data = {
-            "id": animal.id,
-            "name": animal.name,
-            "species": animal.species,
-            "breed": animal.breed,
-            "age": animal.age,
-            "description": animal.description,
-            "image": animal.image,
-            "center_id": animal.center_id,
-            "center": {
-                "id": animal.center.id,
-                "name": animal.center.name,
-                "location": animal.center.location,
-                "contact": animal.center.contact
-            } if animal.center else None
-        }
-        result.append(animal_data)
-    return result
+def get_animals(
+    request: Request,
+    species: Optional[str] = None,
+    breed: Optional[str] = None,
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    center_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = Query("id", regex="^-?(id|name|species|age)$"),
+    fmt: Optional[str] = Query(None, alias="format", regex="^columnar$"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        after = page_position(sort, after_id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def build(headers):
+        return list_animals(
+            db, headers, species, breed, min_age, max_age, center_id, after, limit, sort, fmt == "columnar",
+        )
+
+    return cached_response(request, ("animals", "centers"), build, db)
+
+@app.get("/animals/facets")
+def get_animal_facets(request: Request, db: Session = Depends(get_read_db)):
+    def build(headers):
+        return facet_counts(db)
+
+    return cached_response(request, ("animals",), build, db)
+
+@app.get("/changes")
+def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=MAX_CHANGES),
+    db: Session = Depends(get_read_db),
+):
+    # not cached: every client asks with its own version
+    return FastJSONResponse(changes_since(db, since, limit))
+
+@app.get("/animals/search")
+def search_animals(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    fmt: Optional[str] = Query(None, alias="format", regex="^columnar$"),
+    db: Session = Depends(get_read_db),
+):
+    def build(headers):
+        return search_animals_page(db, q, limit, offset, fmt == "columnar", headers)
+
+    return cached_response(request, ("animals", "centers"), build, db)
 
 @app.get("/centers", response_model=list[Center])
-def get_centers(db: Session = Depends(get_db)):
+def get_centers(request: Request, db: Session = Depends(get_read_db)):
+    def build(headers):
+        return [serialize_center_row(row) for row in db.execute(centers_statement())]
+
     try:
-        centers = db.query(CenterModel).all()
-        return centers
+        return cached_response(request, ("centers",), build, db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/centers/nearby")
+def get_nearby_centers(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(50, gt=0, le=MAX_RADIUS_KM),
+    species: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    def build(headers):
+        return nearby_centers_page(db, lat, lon, radius, species, limit)
+
+    return cached_response(request, ("animals", "centers"), build, db)
+
 @app.post("/adopt")
 def adopt(adoption: AdoptionCreate, db: Session = Depends(get_db)):
-    db_adoption = Adoption(**adoption.dict())
-    db.add(db_adoption)
+    if WRITE_BEHIND_ADOPTIONS:
+        try:
+            queued = adoption_queue.submit(adoption.dict())
+        except QueueFull:
+            raise queue_full_error()
+        return accepted_response(queued)
+
+    db.execute(insert(Adoption).values(**adoption.dict()))
     db.commit()
-    db.refresh(db_adoption)
     return {"message": "Adoption request submitted"}
 
 @app.post("/animals")
@@ -114,56 +234,92 @@ def create_animal(animal: AnimalCreate, db: Session = Depends(get_db)):
         animal_data = animal.dict()
         if not animal_data.get('image'):
             animal_data['image'] = f"https://picsum.photos/400/300?random={animal_data['center_id']}"
-        
-        db_animal = AnimalModel(**animal_data)
-        db.add(db_animal)
+
+        # the new id comes back from the INSERT itself (lastrowid / RETURNING)
+        result = db.execute(insert(AnimalModel).values(**animal_data))
         db.commit()
-        db.refresh(db_animal)
-        return {"message": "Animal created successfully", "id": db_animal.id}
+        response_cache.bump("animals")
+        return {"message": "Animal created successfully", "id": result.inserted_primary_key[0]}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error creating animal: {str(e)}")
 
+@app.post("/animals/bulk")
+async def bulk_create_animals(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", regex="^(csv|ndjson)$"),
+    db: Session = Depends(get_db),
+):
+    records = upload_records(request, fmt)
+
+    async def load_chunk(chunk):
+        return await run_in_threadpool(load_animal_chunk, db, chunk)
+
+    return await ingest_animals(records, load_chunk, on_insert=lambda: response_cache.bump("animals"))
+
 @app.put("/animals/{animal_id}")
 def update_animal(animal_id: int, animal: AnimalUpdate, db: Session = Depends(get_db)):
-    db_animal = db.query(AnimalModel).filter(AnimalModel.id == animal_id).first()
-    if not db_animal:
-        raise HTTPException(status_code=404, detail="Animal not found")
-    
     update_data = animal.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_animal, field, value)
-    
+    if not update_data:
+        # nothing to change, but still tell the caller if the animal is missing
+        found = db.execute(select(AnimalModel.id).where(AnimalModel.id == animal_id)).first()
+        if not found:
+            raise HTTPException(status_code=404, detail="Animal not found")
+        return {"message": "Animal updated successfully"}
+
+    # one UPDATE by id, the rowcount says whether the animal exists
+    result = db.execute(update(AnimalModel).where(AnimalModel.id == animal_id).values(**update_data))
     db.commit()
-    db.refresh(db_animal)
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Animal not found")
+    response_cache.bump("animals")
     return {"message": "Animal updated successfully"}
 
 @app.delete("/animals/{animal_id}")
 def delete_animal(animal_id: int, db: Session = Depends(get_db)):
-    db_animal = db.query(AnimalModel).filter(AnimalModel.id == animal_id).first()
-    if not db_animal:
-        raise HTTPException(status_code=404, detail="Animal not found")
-    
-    db.delete(db_animal)
+    result = db.execute(delete(AnimalModel).where(AnimalModel.id == animal_id))
     db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Animal not found")
+    response_cache.bump("animals")
     return {"message": "Animal deleted successfully"}
 
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/test")
 def test_endpoint():
     return {"message": "Backend is working!", "timestamp": "2024"}
 
 @app.post("/sql")
-def execute_sql(request: dict, db: Session = Depends(get_db)):
-    query = request.get('query', '')
-    if not query:
-        return {"error": "No query provided"}
-    
-    sql_engine = SimpleSQL(db)
-    result = sql_engine.execute_query(query)
-    return result
+async def execute_sql(
+    request: dict,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    options = read_sql_request(request)
+    if 'error' in options:
+        return options
+
+    # sessions only connect when first used, so the other one costs nothing
+    sql_engine = SimpleSQL(
+        read_db if options["read_only"] else db, on_write=response_cache.bump_all,
+        timeout=options["timeout"], max_scan_steps=options["max_scan_steps"],
+    )
+
+    async def execute(*args, **kwargs):
+        return await run_in_threadpool(sql_engine.execute_query, *args, **kwargs)
+
+    return await run_sql_request(http_request, sql_engine, options, execute)
 
 @app.get("/tables")
-def get_tables():
+def get_tables(request: Request):
+    return cached_response(request, ("schema",), describe_tables)
+
+def describe_tables(headers):
     # Return info about our database schema
     return {
         "tables": {
@@ -178,7 +334,7 @@ def get_tables():
                 "foreign_keys": {"center_id": "centers.id"}
             },
             "centers": {
-                "columns": ["id", "name", "location", "contact"],
+                "columns": ["id", "name", "location", "contact", "latitude", "longitude"],
                 "primary_key": "id"
             },
             "adoptions": {
@@ -197,17 +353,36 @@ def reset_database(db: Session = Depends(get_db)):
         db.query(AnimalModel).delete()
         db.query(CenterModel).delete()
         db.query(User).delete()
+        reset_change_log(db)
         db.commit()
+        response_cache.bump_all()
         return {"message": "Database reset successfully"}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error resetting database: {str(e)}")
 
 @app.post("/load-sample-data")
-def load_sample_data_endpoint(db: Session = Depends(get_db)):
+def load_sample_data_endpoint(
+    animals: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    centers: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    users: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    adoptions: Optional[int] = Query(None, ge=0, le=MAX_GENERATED_ROWS),
+    seed: int = 0,
+    db: Session = Depends(get_db),
+):
+    # without ?animals= this loads the small fixed demo set, with it a
+    # generated data set of that size (see sample_data.generate_sample_data)
     try:
-        create_sample_data(db)
-        return {"message": "Sample data loaded successfully"}
+        if animals is None:
+            create_sample_data(db)
+            loaded = None
+        else:
+            loaded = generate_sample_data(db, animals, centers, users, adoptions, seed)
+        response_cache.bump("animals", "centers")
+        return {"message": "Sample data loaded successfully", "loaded": loaded}
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error loading sample data: {str(e)}")
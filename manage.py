@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Deployment tasks, run once per deploy rather than by every worker.
+
+    python manage.py migrate            bring the schema up to date
+    python manage.py migrate --seed     ...then load the sample data
+    python manage.py downgrade <rev>    roll the schema back to a revision
+    python manage.py seed               load the sample data into an empty database
+    python manage.py seed --animals N   add a generated data set of N animals
+    python manage.py facets [--rebuild] check the facet counts (or recount them)
+    python manage.py compact-changes    compact the /changes log now
+"""
+import argparse
+import logging
+import os
+import time
+
+from database import SessionLocal
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    # absolute, so this works from any working directory
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def migrate(revision="head", seed=False):
+    from alembic import command
+
+    command.upgrade(alembic_config(), revision)
+    if seed:
+        load_sample_data()
+
+
+def downgrade(revision):
+    from alembic import command
+
+    command.downgrade(alembic_config(), revision)
+
+
+def load_sample_data():
+    from sample_data import create_sample_data
+
+    db = SessionLocal()
+    try:
+        create_sample_data(db)
+    finally:
+        db.close()
+
+
+def generate_data(animals, centers=None, users=None, adoptions=None, seed=0):
+    from sample_data import generate_sample_data
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        loaded = generate_sample_data(db, animals, centers, users, adoptions, seed)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    print(", ".join(f"{count} {name}" for name, count in loaded.items()) + f" in {elapsed:.1f}s")
+
+
+def facets(rebuild=False):
+    from facets import check_facets, rebuild_facets
+
+    db = SessionLocal()
+    try:
+        conn = db.connection()
+        if rebuild:
+            rebuild_facets(conn)
+            db.commit()
+            print("facet counts rebuilt")
+            return True
+        mismatches = check_facets(conn)
+    finally:
+        db.close()
+    for facet, value, stored, actual in mismatches:
+        print(f"{facet}={value!r}: stored {stored}, actual {actual}")
+    print(f"{len(mismatches)} facet counts out of date" + (", fix with --rebuild" if mismatches else ""))
+    return not mismatches
+
+
+def compact_changes():
+    from changes import compact_changes
+
+    print(f"{compact_changes()} change log entries removed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RescueMePets deployment tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="apply database migrations")
+    migrate_parser.add_argument("revision", nargs="?", default="head")
+    migrate_parser.add_argument("--seed", action="store_true", help="load the sample data afterwards")
+
+    downgrade_parser = commands.add_parser("downgrade", help="revert database migrations")
+    downgrade_parser.add_argument("revision")
+
+    seed_parser = commands.add_parser("seed", help="load the sample data, or generate a data set with --animals")
+    seed_parser.add_argument("--animals", type=int, help="generate this many animals")
+    seed_parser.add_argument("--centers", type=int, help="default: one per 2,500 animals")
+    seed_parser.add_argument("--users", type=int, help="default: one per 10 animals")
+    seed_parser.add_argument("--adoptions", type=int, help="default: one per 20 animals")
+    seed_parser.add_argument("--seed", type=int, default=0, help="random seed, same seed gives the same data")
+
+    facets_parser = commands.add_parser("facets", help="check the animal facet counts against the animals table")
+    facets_parser.add_argument("--rebuild", action="store_true", help="recount them from scratch")
+
+    commands.add_parser("compact-changes", help="drop superseded and expired change log entries")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    if args.command == "migrate":
+        migrate(args.revision, seed=args.seed)
+    elif args.command == "downgrade":
+        downgrade(args.revision)
+    elif args.command == "seed" and args.animals is not None:
+        generate_data(args.animals, args.centers, args.users, args.adoptions, args.seed)
+    elif args.command == "seed":
+        load_sample_data()
+    elif args.command == "facets" and not facets(args.rebuild):
+        raise SystemExit(1)
+    elif args.command == "compact-changes":
+        compact_changes()
+
+
+if __name__ == "__main__":
+    main()
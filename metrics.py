@@ -0,0 +1,281 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from sql_parser import query_shape, tokenize
+
+logger = logging.getLogger(__name__)
+
+# statements slower than this (in ms) get logged, 0 turns the log off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+
+# cap on distinct SQL statement labels so ad-hoc queries can't blow up memory
+MAX_STATEMENT_LABELS = 500
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """A value that goes up and down, like a queue's length."""
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and a few adds under a lock."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (plus +Inf), then sum and count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests.",
+    ("method", "route", "status"),
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "Database round-trips made while handling a request.",
+    ("method", "route"), buckets=COUNT_BUCKETS,
+)
+SQL_LATENCY = Histogram(
+    "db_statement_duration_seconds", "Time spent executing SQL statements, by normalized statement.",
+    ("statement",),
+)
+CHECKOUT_WAIT = Histogram(
+    "db_connection_checkout_seconds", "Time spent waiting to check a connection out of the pool.",
+)
+ADHOC_LATENCY = Histogram(
+    "adhoc_sql_duration_seconds", "Time spent running ad-hoc SQL through SimpleSQL, by statement kind.",
+    ("kind",),
+)
+SLOW_QUERIES = Counter(
+    "db_slow_statements_total", "Statements slower than SLOW_QUERY_MS.",
+)
+ADOPTION_QUEUE_EVENTS = Counter(
+    "adoption_queue_events_total",
+    "Write-behind adoption requests by outcome: queued, duplicate, rejected (queue full), written, skipped (already stored), failed (rejected by the database, dropped).",
+    ("event",),
+)
+ADOPTION_BATCH_ROWS = Histogram(
+    "adoption_queue_batch_rows", "Adoption requests written per group commit.",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests", "Requests running in each admission pool (sql, write, read).",
+    ("pool",),
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queued_requests", "Requests waiting for a slot in each admission pool.",
+    ("pool",),
+)
+ADMISSION_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a slot in their pool.",
+    ("pool",),
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests turned away by admission control, by pool and reason: queue_full, queue_timeout (503) or client_rate (429).",
+    ("pool", "reason"),
+)
+
+REGISTRY = [
+    REQUEST_LATENCY, REQUEST_DB_STATEMENTS, SQL_LATENCY, CHECKOUT_WAIT, ADHOC_LATENCY, SLOW_QUERIES,
+    ADOPTION_QUEUE_EVENTS, ADOPTION_BATCH_ROWS,
+    ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT, ADMISSION_REJECTIONS,
+]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# statements executed by the current request; a list so that the copies of
+# the context taken for threadpool calls still count into the same place
+_request_statements = contextvars.ContextVar("request_statements", default=None)
+
+_normalized = {}
+
+
+def normalize_statement(statement):
+    """Collapse a statement to its shape: literals become ?, whitespace is squashed."""
+    shape = _normalized.get(statement)
+    if shape is not None:
+        return shape
+    shape = query_shape(tokenize(statement))
+    if len(_normalized) >= 4 * MAX_STATEMENT_LABELS:
+        _normalized.clear()
+    _normalized[statement] = shape
+    return shape
+
+
+_statement_labels = set()
+
+
+def _statement_label(statement):
+    shape = normalize_statement(statement)
+    if shape in _statement_labels:
+        return shape
+    if len(_statement_labels) >= MAX_STATEMENT_LABELS:
+        return "other"
+    _statement_labels.add(shape)
+    return shape
+
+
+def instrument_engine(engine):
+    """Time every statement and pool checkout on the engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+        counter = _request_statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        SQL_LATENCY.observe(elapsed, _statement_label(statement))
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc()
+            logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+    # dispose() replaces the pool with a fresh one, time that one too
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(engine):
+        _time_checkouts(engine.pool)
+
+    _time_checkouts(engine.pool)
+
+
+def _time_checkouts(pool):
+    # the pool has no "before checkout" event (its "checkout" fires once a
+    # connection is in hand), so time the checkout itself
+    do_get = pool._do_get
+
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_do_get
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB round-trips per route."""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_path(self, scope):
+        # the router leaves the matched endpoint in the scope, map it back
+        # to the route template so /animals/1 and /animals/2 share a label
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        statements = [0]
+        token = _request_statements.set(statements)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_statements.reset(token)
+            route = self._route_path(scope)
+            REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], route, str(status[0]))
+            REQUEST_DB_STATEMENTS.observe(statements[0], scope["method"], route)
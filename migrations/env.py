@@ -0,0 +1,63 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+import models  # noqa: F401, registers the tables on Base.metadata
+from database import Base, engine
+
+config = context.config
+
+# skip logging setup when called from manage.py, which has its own
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # leave alone tables the models don't describe: the FTS5 index and its
+    # shadow tables, and anything created through /sql
+    return not (type_ == "table" and reflected and compare_to is None)
+
+
+def run_migrations_offline():
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=engine.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # a caller running alembic.command itself may hand over its own
+    # connection in config.attributes; manage.py and the alembic CLI don't,
+    # they migrate through the app's engine
+    connection = config.attributes.get("connection")
+    if connection is None:
+        with engine.connect() as connection:
+            run_with_connection(connection)
+    else:
+        run_with_connection(connection)
+
+
+def run_with_connection(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite can't ALTER most things, batch mode rebuilds the table instead
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,110 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Databases created before migrations (by Base.metadata.create_all at
+startup) already have these tables, so each table and index is only
+created when it's missing; running this against such a database just
+fills in any indexes it lacks and stamps it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def tables():
+    return [
+        (
+            "users",
+            [
+                sa.Column("id", sa.Integer(), nullable=False),
+                sa.Column("username", sa.String(), nullable=True),
+                sa.Column("email", sa.String(), nullable=True),
+                sa.Column("password", sa.String(), nullable=True),
+                sa.PrimaryKeyConstraint("id"),
+            ],
+            [
+                ("ix_users_id", ["id"], False),
+                ("ix_users_username", ["username"], True),
+                ("ix_users_email", ["email"], True),
+            ],
+        ),
+        (
+            "centers",
+            [
+                sa.Column("id", sa.Integer(), nullable=False),
+                sa.Column("name", sa.String(), nullable=True),
+                sa.Column("location", sa.String(), nullable=True),
+                sa.Column("contact", sa.String(), nullable=True),
+                sa.PrimaryKeyConstraint("id"),
+            ],
+            [
+                ("ix_centers_id", ["id"], False),
+                ("ix_centers_name", ["name"], False),
+            ],
+        ),
+        (
+            "animals",
+            [
+                sa.Column("id", sa.Integer(), nullable=False),
+                sa.Column("name", sa.String(), nullable=True),
+                sa.Column("species", sa.String(), nullable=True),
+                sa.Column("breed", sa.String(), nullable=True),
+                sa.Column("age", sa.Integer(), nullable=True),
+                sa.Column("description", sa.Text(), nullable=True),
+                sa.Column("image", sa.String(), nullable=True),
+                sa.Column("center_id", sa.Integer(), nullable=True),
+                sa.ForeignKeyConstraint(["center_id"], ["centers.id"]),
+                sa.PrimaryKeyConstraint("id"),
+            ],
+            [
+                ("ix_animals_id", ["id"], False),
+                ("ix_animals_name", ["name"], False),
+                ("ix_animals_center_id_id", ["center_id", "id"], False),
+                ("ix_animals_species_breed_id", ["species", "breed", "id"], False),
+                ("ix_animals_species_age_id", ["species", "age", "id"], False),
+                ("ix_animals_age_id", ["age", "id"], False),
+            ],
+        ),
+        (
+            "adoptions",
+            [
+                sa.Column("id", sa.Integer(), nullable=False),
+                sa.Column("user_id", sa.Integer(), nullable=True),
+                sa.Column("animal_id", sa.Integer(), nullable=True),
+                sa.Column("message", sa.Text(), nullable=True),
+                sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+                sa.ForeignKeyConstraint(["animal_id"], ["animals.id"]),
+                sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+                sa.PrimaryKeyConstraint("id"),
+            ],
+            [
+                ("ix_adoptions_id", ["id"], False),
+            ],
+        ),
+    ]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing_tables = set(inspector.get_table_names())
+    for name, columns, indexes in tables():
+        if name not in existing_tables:
+            op.create_table(name, *columns)
+            existing_indexes = set()
+        else:
+            existing_indexes = {index["name"] for index in inspector.get_indexes(name)}
+        for index_name, index_columns, unique in indexes:
+            if index_name not in existing_indexes:
+                op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def downgrade():
+    for name, _, _ in reversed(tables()):
+        op.drop_table(name)
@@ -0,0 +1,69 @@
+"""animals full-text index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+FTS5 index over the searchable animal columns (see search.py). It's an
+external-content table, so it stores only the index and reads the text
+back from animals; the triggers keep it in step with every write, ORM,
+Core or raw /sql. SQLite only, other databases search with ILIKE.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts USING fts5(
+        name, breed, species, description,
+        content='animals', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS animals_fts_insert AFTER INSERT ON animals BEGIN
+        INSERT INTO animals_fts(rowid, name, breed, species, description)
+        VALUES (new.id, new.name, new.breed, new.species, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS animals_fts_delete AFTER DELETE ON animals BEGIN
+        INSERT INTO animals_fts(animals_fts, rowid, name, breed, species, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.species, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS animals_fts_update AFTER UPDATE OF name, breed, species, description ON animals BEGIN
+        INSERT INTO animals_fts(animals_fts, rowid, name, breed, species, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.species, old.description);
+        INSERT INTO animals_fts(rowid, name, breed, species, description)
+        VALUES (new.id, new.name, new.breed, new.species, new.description);
+    END
+    """,
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    # earlier versions built the index at startup, only backfill a new one
+    existed = bind.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'animals_fts'"
+    ).first() is not None
+    for statement in FTS_DDL:
+        op.execute(statement)
+    if not existed:
+        op.execute("INSERT INTO animals_fts(animals_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for trigger in ("animals_fts_insert", "animals_fts_delete", "animals_fts_update"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS animals_fts")
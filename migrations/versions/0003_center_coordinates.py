@@ -0,0 +1,91 @@
+"""center coordinates and spatial index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+Adds latitude/longitude to centers, filled in from the bundled gazetteer
+for the locations it knows, and an index on animals (center_id, species)
+for per-center counts. On SQLite the coordinates are also kept in an
+R*Tree (centers_rtree) that triggers on centers keep in step with every
+write, so /centers/nearby can look up a bounding box without scanning.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from gazetteer import coordinates
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+RTREE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS centers_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    """
+    CREATE TRIGGER IF NOT EXISTS centers_rtree_insert AFTER INSERT ON centers
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO centers_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS centers_rtree_delete AFTER DELETE ON centers BEGIN
+        DELETE FROM centers_rtree WHERE id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS centers_rtree_update AFTER UPDATE OF id, latitude, longitude ON centers BEGIN
+        DELETE FROM centers_rtree WHERE id = old.id;
+        INSERT INTO centers_rtree
+        SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END
+    """,
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column["name"] for column in inspector.get_columns("centers")}
+    with op.batch_alter_table("centers") as batch:
+        for name in ("latitude", "longitude"):
+            if name not in columns:
+                batch.add_column(sa.Column(name, sa.Float(), nullable=True))
+    if "ix_animals_center_id_species" not in {index["name"] for index in inspector.get_indexes("animals")}:
+        op.create_index("ix_animals_center_id_species", "animals", ["center_id", "species"])
+
+    # geocode what's there; rows added later get coordinates from whoever inserts them
+    centers = sa.table("centers", sa.column("id"), sa.column("location"), sa.column("latitude"))
+    rows = bind.execute(sa.select(centers.c.id, centers.c.location).where(centers.c.latitude.is_(None))).all()
+    for center_id, location in rows:
+        latitude, longitude = coordinates(location)
+        if latitude is not None:
+            bind.execute(
+                sa.text("UPDATE centers SET latitude = :latitude, longitude = :longitude WHERE id = :id"),
+                {"latitude": latitude, "longitude": longitude, "id": center_id},
+            )
+
+    if bind.dialect.name != "sqlite":
+        return
+    existed = bind.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'centers_rtree'"
+    ).first() is not None
+    for statement in RTREE_DDL:
+        op.execute(statement)
+    if not existed:
+        op.execute(
+            "INSERT INTO centers_rtree SELECT id, latitude, latitude, longitude, longitude"
+            " FROM centers WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        for trigger in ("centers_rtree_insert", "centers_rtree_delete", "centers_rtree_update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS centers_rtree")
+    op.drop_index("ix_animals_center_id_species", table_name="animals")
+    with op.batch_alter_table("centers") as batch:
+        batch.drop_column("longitude")
+        batch.drop_column("latitude")
@@ -0,0 +1,26 @@
+"""adoptions (user_id, animal_id) index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Lets the write-behind /adopt queue skip requests already stored for the
+same user and animal without scanning adoptions.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    indexes = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("adoptions")}
+    if "ix_adoptions_user_id_animal_id" not in indexes:
+        op.create_index("ix_adoptions_user_id_animal_id", "adoptions", ["user_id", "animal_id"])
+
+
+def downgrade():
+    op.drop_index("ix_adoptions_user_id_animal_id", table_name="adoptions")
@@ -0,0 +1,106 @@
+"""animal facet counts
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+Summary table of animal counts per species, breed, age bucket and center
+behind /animals/facets. On SQLite triggers on animals keep it up to date
+(like the FTS index in 0002), so facet reads never touch animals; other
+databases leave it empty and count on each request (see facets.py);
+0007 adds the PostgreSQL triggers.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def bucket(row):
+    return (
+        f"CASE WHEN {row}.age IS NULL THEN 'unknown' WHEN {row}.age <= 1 THEN '0-1'"
+        f" WHEN {row}.age <= 3 THEN '2-3' WHEN {row}.age <= 7 THEN '4-7' ELSE '8+' END"
+    )
+
+
+def facet_values(row):
+    return [
+        ("species", f"coalesce({row}.species, '')"),
+        ("breed", f"coalesce({row}.breed, '')"),
+        ("age", bucket(row)),
+        ("center_id", f"coalesce(CAST({row}.center_id AS TEXT), '')"),
+    ]
+
+
+def add(row):
+    values = ", ".join(f"('{facet}', {expression})" for facet, expression in facet_values(row))
+    return (
+        f"INSERT INTO animal_facets (facet, value, count) SELECT column1, column2, 1 FROM (VALUES {values}) WHERE true"
+        " ON CONFLICT (facet, value) DO UPDATE SET count = animal_facets.count + 1;"
+    )
+
+
+def remove(row):
+    # one primary key lookup per facet; values whose count drops to 0 keep
+    # their row (reads skip them) until the next manage.py facets --rebuild
+    return " ".join(
+        f"UPDATE animal_facets SET count = count - 1 WHERE facet = '{facet}' AND value = {expression};"
+        for facet, expression in facet_values(row)
+    )
+
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS animal_facets_insert AFTER INSERT ON animals BEGIN
+        {add('new')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS animal_facets_delete AFTER DELETE ON animals BEGIN
+        {remove('old')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS animal_facets_update AFTER UPDATE OF species, breed, age, center_id ON animals BEGIN
+        {remove('old')}
+        {add('new')}
+    END
+    """,
+]
+
+COUNT_QUERY = " UNION ALL ".join(
+    f"SELECT '{facet}', {expression}, count(*) FROM animals GROUP BY 2"
+    for facet, expression in facet_values("animals")
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "animal_facets" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "animal_facets",
+            sa.Column("facet", sa.String(), nullable=False),
+            sa.Column("value", sa.String(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("facet", "value"),
+        )
+    if bind.dialect.name != "sqlite":
+        return
+    existed = bind.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'animal_facets_insert'"
+    ).first() is not None
+    for statement in TRIGGERS:
+        op.execute(statement)
+    if not existed:
+        op.execute("DELETE FROM animal_facets")
+        op.execute(f"INSERT INTO animal_facets (facet, value, count) {COUNT_QUERY}")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        for trigger in ("animal_facets_insert", "animal_facets_delete", "animal_facets_update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table("animal_facets")
@@ -0,0 +1,76 @@
+"""change log for incremental sync
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+change_log records every insert, update and delete on animals and centers
+for /changes (see changes.py). On SQLite triggers write it, whichever path
+the change comes from; AUTOINCREMENT keeps versions from ever being reused
+once old entries are compacted away. Rows that existed before this
+revision were never logged, so the log starts with a resync entry.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def log(table, row, change):
+    return f"INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {row}.id, '{change}');"
+
+
+def triggers(table):
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_{table}_insert AFTER INSERT ON {table} BEGIN
+            {log(table, 'new', 'upsert')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_{table}_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO change_log (table_name, row_id, op)
+            SELECT '{table}', old.id, 'delete' WHERE old.id != new.id;
+            {log(table, 'new', 'upsert')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_{table}_delete AFTER DELETE ON {table} BEGIN
+            {log(table, 'old', 'delete')}
+        END
+        """,
+    ]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "change_log" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "change_log",
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("table_name", sa.String(), nullable=False),
+            sa.Column("row_id", sa.Integer(), nullable=True),
+            sa.Column("op", sa.String(), nullable=False),
+            sa.Column("changed_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.PrimaryKeyConstraint("version"),
+            sqlite_autoincrement=True,
+        )
+        op.create_index("ix_change_log_table_name_row_id_version", "change_log", ["table_name", "row_id", "version"])
+    if bind.dialect.name != "sqlite":
+        return
+    for table in ("animals", "centers"):
+        for statement in triggers(table):
+            op.execute(statement)
+    if bind.exec_driver_sql("SELECT 1 FROM change_log LIMIT 1").first() is None:
+        op.execute("INSERT INTO change_log (table_name, row_id, op) VALUES ('*', NULL, 'resync')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        for table in ("animals", "centers"):
+            for change in ("insert", "update", "delete"):
+                op.execute(f"DROP TRIGGER IF EXISTS change_log_{table}_{change}")
+    op.drop_table("change_log")
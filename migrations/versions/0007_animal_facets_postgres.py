@@ -0,0 +1,81 @@
+"""animal facet triggers on PostgreSQL
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+0005 only kept animal_facets current on SQLite, so PostgreSQL counted the
+whole animals table on every /animals/facets request. One plpgsql row
+trigger does what the three SQLite triggers do, and the table is filled
+from animals once here.
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def facet_values(row):
+    return [
+        ("species", f"coalesce({row}.species, '')"),
+        ("breed", f"coalesce({row}.breed, '')"),
+        ("age", (
+            f"CASE WHEN {row}.age IS NULL THEN 'unknown' WHEN {row}.age <= 1 THEN '0-1'"
+            f" WHEN {row}.age <= 3 THEN '2-3' WHEN {row}.age <= 7 THEN '4-7' ELSE '8+' END"
+        )),
+        ("center_id", f"coalesce(CAST({row}.center_id AS TEXT), '')"),
+    ]
+
+
+def rows(row):
+    return ", ".join(f"('{facet}', {expression})" for facet, expression in facet_values(row))
+
+
+# same bookkeeping as the SQLite triggers: values whose count drops to 0
+# keep their row (reads skip them) until manage.py facets --rebuild
+FUNCTION = f"""
+CREATE OR REPLACE FUNCTION animal_facets_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE animal_facets SET count = count - 1 WHERE (facet, value) IN (VALUES {rows('OLD')});
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO animal_facets (facet, value, count) SELECT facet, value, 1 FROM (VALUES {rows('NEW')}) AS v (facet, value)
+            ON CONFLICT (facet, value) DO UPDATE SET count = animal_facets.count + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGER = """
+CREATE TRIGGER animal_facets_change AFTER INSERT OR DELETE OR UPDATE OF species, breed, age, center_id ON animals
+    FOR EACH ROW EXECUTE FUNCTION animal_facets_change()
+"""
+
+COUNT_QUERY = " UNION ALL ".join(
+    f"SELECT '{facet}', {expression}, count(*) FROM animals GROUP BY 2"
+    for facet, expression in facet_values("animals")
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute(FUNCTION)
+    op.execute("DROP TRIGGER IF EXISTS animal_facets_change ON animals")
+    op.execute(TRIGGER)
+    # 0005 left the table empty here; CREATE TRIGGER holds a lock that keeps
+    # writers out until this migration commits, so nothing is counted twice
+    op.execute("DELETE FROM animal_facets")
+    op.execute(f"INSERT INTO animal_facets (facet, value, count) {COUNT_QUERY}")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP TRIGGER IF EXISTS animal_facets_change ON animals")
+    op.execute("DROP FUNCTION IF EXISTS animal_facets_change()")
+    op.execute("DELETE FROM animal_facets")
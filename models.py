@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import database
@@ -26,6 +26,17 @@ class Animal(Base):
 
     center = relationship("Center")
 
+    # composite indexes backing the /animals filters and keyset pagination,
+    # id is the trailing column so each one also serves the cursor
+    __table_args__ = (
+        Index("ix_animals_center_id_id", "center_id", "id"),
+        Index("ix_animals_species_breed_id", "species", "breed", "id"),
+        Index("ix_animals_species_age_id", "species", "age", "id"),
+        Index("ix_animals_age_id", "age", "id"),
+        # counts per center (and species) for /centers/nearby, from the index alone
+        Index("ix_animals_center_id_species", "center_id", "species"),
+    )
+
 class Center(Base):
     __tablename__ = "centers"
 
@@ -33,6 +44,32 @@ class Center(Base):
     name = Column(String, index=True)
     location = Column(String)
     contact = Column(String)
+    # from the offline gazetteer (gazetteer.py), None when the location isn't in it
+    latitude = Column(Float)
+    longitude = Column(Float)
+
+class AnimalFacet(Base):
+    """Animals per facet value (species, breed, age bucket, center), see facets.py."""
+    __tablename__ = "animal_facets"
+
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+class ChangeLog(Base):
+    """One insert, update or delete on animals or centers, see changes.py."""
+    __tablename__ = "change_log"
+
+    version = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer)
+    op = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_change_log_table_name_row_id_version", "table_name", "row_id", "version"),
+        {"sqlite_autoincrement": True},
+    )
 
 class Adoption(Base):
     __tablename__ = "adoptions"
@@ -45,3 +82,8 @@ class Adoption(Base):
 
     user = relationship("User")
     animal = relationship("Animal")
+
+    # duplicate check for the write-behind /adopt queue
+    __table_args__ = (
+        Index("ix_adoptions_user_id_animal_id", "user_id", "animal_id"),
+    )
@@ -1,5 +1,14 @@
+import math
+import random
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from sqlalchemy import func, select, text
 from sqlalchemy.orm import Session
 import models
+from ingest import begin_transaction, restore_insert_triggers, suspend_insert_triggers
+from gazetteer import coordinates
 
 def create_sample_data(db: Session):
     # Check if sample data already exists
@@ -11,6 +20,8 @@ def create_sample_data(db: Session):
     center2 = models.Center(name="Mountain View Pet Sanctuary", location="Denver, Colorado", contact="help@mountainviewpets.com")
     center3 = models.Center(name="Ocean Breeze Rescue Center", location="San Diego, California", contact="adopt@oceanbreezerescue.org")
     center4 = models.Center(name="Forest Friends Animal Shelter", location="Portland, Oregon", contact="contact@forestfriends.net")
+    for center in (center1, center2, center3, center4):
+        center.latitude, center.longitude = coordinates(center.location)
     db.add(center1)
     db.add(center2)
     db.add(center3)
@@ -37,3 +48,287 @@ def create_sample_data(db: Session):
         db.add(animal)
     
     db.commit()
+
+
+# Generated data for load testing. Everything is drawn from one seeded
+# random.Random, so the same seed and sizes always give the same rows.
+
+# (species, share of intakes, breeds with relative frequency, max age)
+SPECIES = [
+    ("Dog", 46, [
+        ("Mixed Breed", 30), ("Pit Bull Mix", 14), ("Labrador Retriever", 10), ("Chihuahua", 8),
+        ("German Shepherd", 6), ("Beagle", 4), ("Boxer", 3), ("Australian Shepherd", 3),
+        ("Border Collie", 3), ("Husky", 3), ("Dachshund", 2), ("Rottweiler", 2),
+        ("Golden Retriever", 2), ("Shih Tzu", 2), ("Poodle", 2), ("Great Dane", 1),
+    ], 15),
+    ("Cat", 40, [
+        ("Domestic Shorthair", 45), ("Domestic Longhair", 12), ("Tabby", 12), ("Siamese", 6),
+        ("Maine Coon", 5), ("Russian Blue", 4), ("Persian", 4), ("British Shorthair", 3),
+        ("Ragdoll", 3), ("Bengal", 2), ("Sphynx", 1),
+    ], 18),
+    ("Rabbit", 7, [("Mixed Breed", 5), ("Holland Lop", 3), ("Lionhead", 2), ("Rex", 1)], 9),
+    ("Bird", 4, [("Parakeet", 5), ("Cockatiel", 3), ("Lovebird", 2), ("Conure", 1)], 20),
+    ("Guinea Pig", 2, [("American", 3), ("Abyssinian", 2), ("Peruvian", 1)], 6),
+    ("Hamster", 1, [("Syrian", 3), ("Dwarf", 2)], 3),
+]
+
+# shelters take in far more young animals than old ones
+AGE_FALLOFF = 0.72
+
+ANIMAL_NAMES = [
+    "Luna", "Bella", "Charlie", "Lucy", "Max", "Daisy", "Milo", "Oliver", "Cooper", "Nala",
+    "Rocky", "Zoe", "Willow", "Duke", "Cleo", "Smokey", "Bear", "Lily", "Loki", "Penny",
+    "Buddy", "Rosie", "Jack", "Sadie", "Tucker", "Molly", "Ginger", "Oreo", "Shadow", "Pepper",
+    "Coco", "Leo", "Simba", "Chloe", "Toby", "Maple", "Ziggy", "Hazel", "Biscuit", "Olive",
+    "Bandit", "Mocha", "Juniper", "Gus", "Pumpkin", "Scout", "Winnie", "Finn", "Poppy", "Archie",
+]
+
+TEMPERAMENTS = [
+    "Calm and affectionate", "Playful and curious", "Shy at first but very sweet",
+    "Energetic and intelligent", "Gentle and easygoing", "Independent but loving",
+    "Social and outgoing", "Mellow and cuddly", "Bright and eager to please",
+]
+
+DESCRIPTION_DETAILS = [
+    "loves long walks", "enjoys quiet companionship", "great with kids", "good with other dogs",
+    "gets along with cats", "house-trained", "knows basic commands", "loves belly rubs",
+    "prefers to be the only pet", "would do best in a home without small children",
+    "enjoys sunny windowsills", "loves to play fetch", "has a beautiful coat",
+    "is looking for a patient family", "came in as a stray and has blossomed in foster care",
+    "is up to date on vaccinations", "is spayed or neutered", "needs a special diet",
+    "loves car rides", "is a champion napper", "will follow you from room to room",
+]
+
+# real towns, so the locations look like the ones shelters enter by hand
+CENTER_CITIES = [
+    ("Austin", "Texas"), ("Denver", "Colorado"), ("San Diego", "California"), ("Portland", "Oregon"),
+    ("Seattle", "Washington"), ("Phoenix", "Arizona"), ("Chicago", "Illinois"), ("Atlanta", "Georgia"),
+    ("Boston", "Massachusetts"), ("Nashville", "Tennessee"), ("Minneapolis", "Minnesota"),
+    ("Salt Lake City", "Utah"), ("Albuquerque", "New Mexico"), ("Kansas City", "Missouri"),
+    ("Columbus", "Ohio"), ("Charlotte", "North Carolina"), ("Tampa", "Florida"), ("Miami", "Florida"),
+    ("Houston", "Texas"), ("Dallas", "Texas"), ("San Antonio", "Texas"), ("Los Angeles", "California"),
+    ("Sacramento", "California"), ("San Francisco", "California"), ("Las Vegas", "Nevada"),
+    ("Boise", "Idaho"), ("Omaha", "Nebraska"), ("Detroit", "Michigan"), ("Pittsburgh", "Pennsylvania"),
+    ("Philadelphia", "Pennsylvania"), ("New York", "New York"), ("Baltimore", "Maryland"),
+    ("Richmond", "Virginia"), ("Raleigh", "North Carolina"), ("New Orleans", "Louisiana"),
+    ("Oklahoma City", "Oklahoma"), ("Milwaukee", "Wisconsin"), ("St. Louis", "Missouri"),
+    ("Louisville", "Kentucky"), ("Indianapolis", "Indiana"), ("Tucson", "Arizona"),
+    ("Spokane", "Washington"), ("Anchorage", "Alaska"), ("Honolulu", "Hawaii"), ("Burlington", "Vermont"),
+]
+
+CENTER_KINDS = ["Animal Shelter", "Humane Society", "Pet Rescue", "Animal Haven", "Rescue Center", "Pet Sanctuary"]
+
+ADOPTION_MESSAGES = [
+    "We'd love to meet {name}!", "Is {name} still available?", "Our family has a big yard for {name}.",
+    "I have adopted before and would give {name} a great home.", "Could we schedule a visit with {name}?",
+]
+
+GENERATED_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# most rows of each kind one /load-sample-data call may generate, so a
+# request can't tie up a worker and the write lock for minutes; bigger
+# data sets are loaded with python manage.py seed
+MAX_GENERATED_ROWS = 100000
+
+# rows generated and inserted at a time; the whole load is one transaction,
+# but only one batch of rows is ever held in memory
+INSERT_BATCH = 20000
+
+# on SQLite, loads at least this big drop the animals indexes and insert
+# triggers (FTS, facets, change log), then catch them up once at the end:
+# keeping them up to date row by row makes a million-row load about five
+# times slower
+BULK_LOAD_ROWS = 50000
+
+
+def _next_id(conn, table):
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _batches(count):
+    for start in range(0, count, INSERT_BATCH):
+        yield start, min(INSERT_BATCH, count - start)
+
+
+def _suspend_animal_indexes(conn):
+    """Drop the animals indexes and insert triggers, returning what it takes to restore them."""
+    indexes = conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'animals' AND sql IS NOT NULL"
+    )).all()
+    for name, _ in indexes:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+    return [statement for _, statement in indexes], suspend_insert_triggers(conn)
+
+
+def _restore_animal_indexes(conn, saved, first_id):
+    indexes, triggers = saved
+    for statement in indexes:
+        conn.execute(text(statement))
+    # a million upserts would be a slower way for clients to say "reload"
+    restore_insert_triggers(conn, triggers, first_id, resync=True)
+
+
+def _generate_centers(rng, first_id, count):
+    rows = []
+    for i in range(count):
+        city, state = rng.choice(CENTER_CITIES)
+        slug = city.lower().replace(" ", "").replace(".", "")
+        # spread a city's centers over its metro area, up to ~15 km out
+        latitude, longitude = coordinates(f"{city}, {state}")
+        distance, bearing = 15 * math.sqrt(rng.random()), rng.uniform(0, 2 * math.pi)
+        rows.append({
+            "id": first_id + i,
+            "name": f"{city} {rng.choice(CENTER_KINDS)} #{first_id + i}",
+            "location": f"{city}, {state}",
+            "contact": f"adopt{first_id + i}@{slug}rescue.org",
+            "latitude": round(latitude + distance * math.cos(bearing) / 111.2, 6),
+            "longitude": round(longitude + distance * math.sin(bearing) / (111.2 * math.cos(math.radians(latitude))), 6),
+        })
+    return rows
+
+
+def _descriptions(rng, count):
+    # a pool of descriptions with a long tail of long ones, drawn from below
+    pool = []
+    for _ in range(count):
+        details = rng.sample(DESCRIPTION_DETAILS, min(len(DESCRIPTION_DETAILS), int(rng.lognormvariate(0.8, 0.5))))
+        description = rng.choice(TEMPERAMENTS)
+        if details:
+            description += ", " + ", ".join(details)
+        pool.append(description)
+    return pool
+
+
+def _generate_animals(rng, first_id, count, center_ids, center_weights, descriptions):
+    # draw each column for all rows at once, choices() with cum_weights is
+    # far cheaper per value than one weighted draw per row
+    species = rng.choices(
+        [name for name, _, _, _ in SPECIES], weights=[share for _, share, _, _ in SPECIES], k=count,
+    )
+    breed = [None] * count
+    age = [None] * count
+    for name, _, breed_list, max_age in SPECIES:
+        rows = [i for i, value in enumerate(species) if value == name]
+        breeds = rng.choices(
+            [breed_name for breed_name, _ in breed_list], weights=[weight for _, weight in breed_list], k=len(rows),
+        )
+        ages = rng.choices(range(max_age + 1), weights=[AGE_FALLOFF ** value for value in range(max_age + 1)], k=len(rows))
+        for i, breed_name, animal_age in zip(rows, breeds, ages):
+            breed[i] = breed_name
+            age[i] = animal_age
+    centers = rng.choices(center_ids, cum_weights=center_weights, k=count)
+    names = rng.choices(range(len(ANIMAL_NAMES)), k=count)
+    descriptions = rng.choices(descriptions, k=count)
+
+    return names, [
+        {
+            "id": first_id + i,
+            "name": ANIMAL_NAMES[names[i]],
+            "species": species[i],
+            "breed": breed[i],
+            "age": age[i],
+            "description": descriptions[i],
+            "image": f"https://picsum.photos/400/300?random={first_id + i}",
+            "center_id": centers[i],
+        }
+        for i in range(count)
+    ]
+
+
+def _generate_users(first_id, count, password_hash):
+    return [
+        {
+            "id": first_id + i,
+            "username": f"user{first_id + i}",
+            "email": f"user{first_id + i}@example.com",
+            "password": password_hash,
+        }
+        for i in range(count)
+    ]
+
+
+def _popular_rank(rng, count):
+    # a rank in [0, count) drawn with weight about 1 / (rank + 1), from the
+    # inverse of the continuous CDF, so it needs no table of count weights
+    return min(int(math.exp(rng.random() * math.log(count + 1))) - 1, count - 1)
+
+
+def _generate_adoptions(rng, count, first_user_id, users, first_animal_id, animal_names):
+    # a few animals get most of the interest
+    rows = []
+    for _ in range(count):
+        rank = _popular_rank(rng, len(animal_names))
+        rows.append({
+            "user_id": first_user_id + rng.randrange(users),
+            "animal_id": first_animal_id + rank,
+            "message": rng.choice(ADOPTION_MESSAGES).format(name=ANIMAL_NAMES[animal_names[rank]]),
+            "created_at": GENERATED_EPOCH + timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+        })
+    return rows
+
+
+def generate_sample_data(db: Session, animals, centers=None, users=None, adoptions=None, seed=0):
+    """Append a seeded, production-shaped data set and return the row counts.
+
+    Centers default to one per 2,500 animals (at least 4), users to one per
+    10 animals and adoptions to one per 20. Rows are generated and added
+    INSERT_BATCH at a time with bulk Core inserts, all in one transaction,
+    after whatever the database already holds.
+    Generated users all share the password "password".
+    """
+    if centers is None:
+        centers = max(4, animals // 2500)
+    if users is None:
+        users = animals // 10
+    if adoptions is None:
+        adoptions = animals // 20 if users and animals else 0
+    if adoptions and not (users and animals):
+        raise ValueError("adoptions need at least one user and one animal")
+    if animals and not centers:
+        raise ValueError("animals need at least one center")
+
+    rng = random.Random(seed)
+    conn = db.connection()
+    tables = {name: models.Base.metadata.tables[name] for name in ("centers", "animals", "users", "adoptions")}
+
+    center_rows = _generate_centers(rng, _next_id(conn, tables["centers"]), centers)
+    if center_rows:
+        conn.execute(tables["centers"].insert(), center_rows)
+    # bigger centers take in more animals: weight centers by a Zipf-like curve
+    center_ids = [row["id"] for row in center_rows]
+    center_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(center_ids))))
+    descriptions = _descriptions(rng, 4096)
+
+    # adoptions only need each animal's name, and the ids run on from the
+    # first one, so one byte per animal (an index into ANIMAL_NAMES) is kept
+    first_animal_id = _next_id(conn, tables["animals"])
+    animal_names = array("B")
+    # DDL is transactional in SQLite, other connections never see the
+    # table without its indexes
+    bulk = conn.dialect.name == "sqlite" and animals >= BULK_LOAD_ROWS
+    if bulk:
+        begin_transaction(conn)
+    saved = _suspend_animal_indexes(conn) if bulk else None
+    for start, size in _batches(animals):
+        names, rows = _generate_animals(
+            rng, first_animal_id + start, size, center_ids, center_weights, descriptions,
+        )
+        conn.execute(tables["animals"].insert(), rows)
+        animal_names.extend(names)
+    if bulk:
+        _restore_animal_indexes(conn, saved, first_animal_id)
+
+    first_user_id = _next_id(conn, tables["users"])
+    if users:
+        # one hash for everybody, hashing each one would take hours at bcrypt cost
+        from security import get_password_hash
+        password_hash = get_password_hash("password")
+        for start, size in _batches(users):
+            conn.execute(tables["users"].insert(), _generate_users(first_user_id + start, size, password_hash))
+
+    for _, size in _batches(adoptions):
+        rows = _generate_adoptions(rng, size, first_user_id, users, first_animal_id, animal_names)
+        conn.execute(tables["adoptions"].insert(), rows)
+
+    db.commit()
+    return {"centers": centers, "animals": animals, "users": users, "adoptions": adoptions}
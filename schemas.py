@@ -37,17 +37,21 @@ class Animal(AnimalBase):
 
     class Config:
         from_attributes = True
+        orm_mode = True
 
 class CenterBase(BaseModel):
     name: str
     location: str
     contact: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class Center(CenterBase):
     id: int
 
     class Config:
         from_attributes = True
+        orm_mode = True
 
 class AdoptionCreate(BaseModel):
     user_id: int
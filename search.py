@@ -0,0 +1,107 @@
+import os
+import re
+
+from sqlalchemy import or_, text
+
+from catalog import animal_columns, animal_rows_statement, serialize_animal_row
+from models import Animal as AnimalModel
+
+# Searches go through the animals_fts FTS5 table that migration 0002
+# creates on SQLite, kept up to date by triggers on animals.
+
+# per-column BM25 weights: name, breed, species, description
+BM25_WEIGHTS = "10.0, 5.0, 5.0, 1.0"
+
+# words too common in descriptions to help ranking, dropping them keeps
+# the posting lists FTS5 has to merge short
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "to", "very", "with",
+}
+
+SEARCHABLE_COLUMNS = ("name", "breed", "species", "description")
+
+# Every match is ranked by BM25 unless SEARCH_MAX_CANDIDATES is set, which
+# ranks only that many of the most recently added matches. Scoring costs a
+# few microseconds per match, so on a big catalog a very common word takes
+# hundreds of ms to rank in full; a capped search tells the client with an
+# X-Search-Candidate-Limit header whenever the cap cut the matches short.
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "0"))
+
+
+def search_terms(query):
+    """Split free text into the words worth searching for."""
+    words = re.findall(r"\w+", query.lower())
+    return [word for word in words if word not in STOPWORDS] or words
+
+
+def fts_match_expression(terms):
+    # every term is quoted so user input can never be read as FTS5 syntax;
+    # OR lets an animal match some of the words, BM25 ranks those matching more
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_animal_ids(db, terms, limit, offset):
+    """Return (animal ids for the terms, best BM25 match first, whether the
+    candidate cap left matches unranked)."""
+    if db.get_bind().dialect.name == "sqlite":
+        params = {"match": fts_match_expression(terms), "limit": limit, "offset": offset}
+        if not SEARCH_MAX_CANDIDATES:
+            # FTS5 keeps only the best limit + offset while it scores
+            rows = db.execute(
+                text(
+                    "SELECT rowid FROM animals_fts WHERE animals_fts MATCH :match"
+                    f" ORDER BY bm25(animals_fts, {BM25_WEIGHTS}), rowid DESC LIMIT :limit OFFSET :offset"
+                ),
+                params,
+            )
+            return [row[0] for row in rows], False
+        rows = db.execute(
+            text(
+                "SELECT rowid FROM ("
+                f"  SELECT rowid, bm25(animals_fts, {BM25_WEIGHTS}) AS score FROM animals_fts"
+                "  WHERE animals_fts MATCH :match ORDER BY rowid DESC LIMIT :candidates"
+                ") ORDER BY score, rowid DESC LIMIT :limit OFFSET :offset"
+            ),
+            {**params, "candidates": SEARCH_MAX_CANDIDATES},
+        )
+        ids = [row[0] for row in rows]
+        # matching ids come straight from the index, no scoring needed
+        capped = db.execute(
+            text("SELECT count(*) FROM (SELECT rowid FROM animals_fts WHERE animals_fts MATCH :match LIMIT :over)"),
+            {"match": params["match"], "over": SEARCH_MAX_CANDIDATES + 1},
+        ).scalar() > SEARCH_MAX_CANDIDATES
+        return ids, capped
+
+    # no FTS5 elsewhere: fall back to substring matching, newest first
+    conditions = [
+        getattr(AnimalModel, column).ilike(f"%{term}%")
+        for term in terms for column in SEARCHABLE_COLUMNS
+    ]
+    rows = (
+        db.query(AnimalModel.id)
+        .filter(or_(*conditions))
+        .order_by(AnimalModel.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    return [row[0] for row in rows], False
+
+
+def search_animals_page(db, q, limit, offset, columnar=False, headers=None):
+    """Run a search and return the matching animals, serialized, best first.
+
+    headers, if given, gets X-Search-Candidate-Limit when only the newest
+    SEARCH_MAX_CANDIDATES matches were ranked.
+    """
+    terms = search_terms(q)
+    ids, capped = search_animal_ids(db, terms, limit, offset) if terms else ([], False)
+    if capped and headers is not None:
+        headers["X-Search-Candidate-Limit"] = str(SEARCH_MAX_CANDIDATES)
+    rows = db.execute(animal_rows_statement().where(AnimalModel.id.in_(ids))).all() if ids else []
+    # keep the ranking order from the index
+    by_id = {row[0]: row for row in rows}
+    rows = [by_id[animal_id] for animal_id in ids if animal_id in by_id]
+    if columnar:
+        return animal_columns(rows)
+    return [serialize_animal_row(row) for row in rows]
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt cost factor, each step doubles the work (12 is ~250 ms on one core)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# worker processes doing KDF work, and how many hashes may queue for them
+# before callers wait their turn
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "0")) or os.cpu_count() or 1
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "0")) or HASH_WORKERS * 8
+
+# accounts created before bcrypt have unsalted SHA-256 hex digests; those
+# still verify but are marked deprecated, so verify_and_update hands back a
+# bcrypt hash to store in their place (as it does after a cost change)
+pwd_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+# password hashing
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Return (valid, new_hash), new_hash set when the stored hash is outdated."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def dummy_verify():
+    # same work as a real check, so unknown usernames can't be told apart by timing
+    pwd_context.dummy_verify()
+    return False
+
+class HashPool:
+    """Runs KDF calls in worker processes, off the event loop and the GIL.
+
+    Sync callers (routes on the threadpool) block on the result, async ones
+    await it. At most max_pending calls are in flight; the rest wait for a
+    slot instead of piling up in the executor's queue.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawned, not forked: workers shouldn't inherit the server's
+                # threads or open database connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self._submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        # waiting for a slot blocks, so do that on the threadpool too
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self._submit, fn, *args)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+hash_pool = HashPool()
+
+def hash_password(password):
+    return hash_pool.run(get_password_hash, password)
+
+def check_password(plain_password, hashed_password):
+    """verify_and_update_password on the hash pool."""
+    return hash_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+def reject_unknown_user():
+    return hash_pool.run(dummy_verify)
+
+async def hash_password_async(password):
+    return await hash_pool.run_async(get_password_hash, password)
+
+async def check_password_async(plain_password, hashed_password):
+    return await hash_pool.run_async(verify_and_update_password, plain_password, hashed_password)
+
+async def reject_unknown_user_async():
+    return await hash_pool.run_async(dummy_verify)
@@ -10,7 +10,7 @@ def main():
     if len(sys.argv) > 1:
         # Run single query from command line
         query = ' '.join(sys.argv[1:])
-        result = sql_engine.execute_query(query)
+        result = sql_engine.execute_query(query, stream=True)
         print_result(result)
     else:
         # Interactive mode
@@ -21,7 +21,7 @@ def main():
                 if query.lower() in ['exit', 'quit']:
                     break
                 if query.strip():
-                    result = sql_engine.execute_query(query)
+                    result = sql_engine.execute_query(query, stream=True)
                     print_result(result)
             except KeyboardInterrupt:
                 print("\nGoodbye!")
@@ -30,8 +30,28 @@ def main():
     db.close()
 
 def print_result(result):
-    if 'error' in result:
+    if 'results' in result:
+        # several statements, print each one's result in turn
+        for statement_result in result['results']:
+            print_result(statement_result)
+    elif 'error' in result:
         print(f"Error: {result['error']}")
+    elif 'batches' in result:
+        # streamed SELECT: print each batch as soon as it's fetched
+        headers = result['columns']
+        print(" | ".join(headers))
+        print("-" * (len(" | ".join(headers))))
+        for batch in result['batches']:
+            for row in batch:
+                print(" | ".join(str(value) for value in row))
+        summary = result['summary']
+        if 'error' in summary:
+            # cancelled part way through: the rows above are all there is
+            print(f"Error: {summary['error']}")
+        if summary['row_count'] == 0:
+            print("No results")
+        elif summary['truncated']:
+            print(f"({summary['row_count']} rows, truncated)")
     elif 'data' in result:
         data = result['data']
         if data:
@@ -1,110 +1,354 @@
+import os
 import re
+import threading
+import time
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 from models import User, Animal, Center, Adoption
+from sql_parser import parse
+from metrics import ADHOC_LATENCY
+from index_advisor import query_stats
+from database import sqlite3_connection
+
+# per-query limits for ad-hoc SQL, 0 or unset turns a limit off
+DEFAULT_TIMEOUT = float(os.getenv("SQL_QUERY_TIMEOUT", "30")) or None
+DEFAULT_MAX_SCAN_STEPS = int(os.getenv("SQL_MAX_SCAN_STEPS", "0")) or None
+
+# SQLite calls the progress handler every this many VM instructions
+PROGRESS_INTERVAL = 1000
+
+# Postgres SQLSTATE for a statement stopped by statement_timeout or a cancel
+QUERY_CANCELED = "57014"
 
 class SimpleSQL:
-    def __init__(self, db_session):
+    def __init__(self, db_session, on_write=None, timeout=DEFAULT_TIMEOUT, max_scan_steps=DEFAULT_MAX_SCAN_STEPS):
         self.db = db_session
+        # called after every committed write so callers can drop cached reads
+        self.on_write = on_write
+        # time budget in seconds, and a budget of SQLite VM steps which
+        # grows with the number of rows a query scans
+        self.timeout = timeout
+        self.max_scan_steps = max_scan_steps
+        self._cancelled = threading.Event()
+        self._budget_active = False
+        self._run = None
+        self._raw = None
+        self._stop_reason = None
+        self._steps = 0
+        self._started = None
+        self._deadline = None
+        self._kind = None
         
-    def execute_query(self, query_str):
-        # strip whitespace and semicolons
-        query = query_str.strip().rstrip(';')
-        
+    def execute_query(self, query_str, params=None, stream=False, max_rows=None, batch_size=500, explain=False):
+        streaming = False
         try:
-            # figure out what kind of query this is
-            query_upper = query.upper()
-            if query_upper.startswith('SELECT'):
-                return self.handle_select(query)
-            elif query_upper.startswith('INSERT'):
-                return self.handle_insert(query)
-            elif query_upper.startswith('UPDATE'):
-                return self.handle_update(query)
-            elif query_upper.startswith('DELETE'):
-                return self.handle_delete(query)
-            elif query_upper.startswith('CREATE'):
-                return self.handle_create(query)
-            elif query_upper.startswith('DROP'):
-                return self.handle_drop(query)
-            elif query_upper.startswith('SHOW'):
-                return self.handle_show(query)
-            else:
-                return {"error": "Don't know how to handle that query type yet"}
-                
+            statements = parse(query_str)
+            if not statements:
+                return {"error": "No query provided"}
+
+            self._begin_budget()
+            self._kind = statements[0].kind if len(statements) == 1 else "MULTI"
+            results = []
+            for statement in statements:
+                started = time.monotonic()
+                self._arm()
+                # only a lone SELECT gets streamed, batches run to completion
+                result = self.dispatch(
+                    statement, params,
+                    stream=stream and len(statements) == 1,
+                    max_rows=max_rows, batch_size=batch_size, explain=explain,
+                )
+                if not self.db.in_transaction():
+                    # it committed: the connection went back to the pool, its
+                    # handler with it, and may already serve someone else
+                    self._raw = None
+                if 'batches' in result:
+                    # the budget has to cover the fetches too, so it ends with the stream
+                    streaming = True
+                    result["batches"] = self._budgeted(result["batches"], result["summary"], (statement, params, started))
+                    return result
+                if self._stop_reason is not None:
+                    result = self._cancelled_result()
+                elif statement.kind == 'SELECT' and not explain and 'error' not in result:
+                    self._observe(statement, params, started)
+                results.append(result)
+                if 'error' in result:
+                    break
+
+            if len(results) == 1:
+                return results[0]
+            # several statements: one result each, stopping at the first failure
+            if 'error' in results[-1]:
+                return {"error": results[-1]["error"], "results": results}
+            return {"success": True, "results": results}
+
         except Exception as e:
+            if self._stop_reason is not None:
+                return self._cancelled_result()
             # TODO: better error handling
             return {"error": f"Something went wrong: {str(e)}"}
-    
-    def handle_select(self, query):
+        finally:
+            if not streaming:
+                self._finish()
+
+    def dispatch(self, statement, params=None, stream=False, max_rows=None, batch_size=500, explain=False):
+        if explain:
+            return self.handle_explain(statement, params)
+
+        kind = statement.kind
+        if kind == 'SELECT':
+            if stream:
+                return self.stream_select(statement, params, max_rows=max_rows, batch_size=batch_size)
+            return self.handle_select(statement, params, max_rows=max_rows)
+        elif kind in ('INSERT', 'REPLACE'):
+            return self.handle_insert(statement, params)
+        elif kind == 'UPDATE':
+            return self.handle_update(statement, params)
+        elif kind == 'DELETE':
+            return self.handle_delete(statement, params)
+        elif kind == 'CREATE':
+            return self.handle_create(statement, params)
+        elif kind == 'DROP':
+            return self.handle_drop(statement, params)
+        elif kind == 'SHOW':
+            return self.handle_show(statement)
+        elif kind == 'EXPLAIN':
+            return self.handle_explain(statement, params)
+        else:
+            return {"error": "Don't know how to handle that query type yet"}
+
+    def cancel(self):
+        # safe to call from any thread, the running query stops at the next
+        # progress callback (SQLite) or is cancelled on the server (Postgres)
+        # and comes back as a cancelled error
+        self._cancelled.set()
+        raw = self._raw
+        if raw is not None and hasattr(raw, "cancel"):
+            try:
+                raw.cancel()
+            except Exception:
+                pass
+
+    def _begin_budget(self):
+        self._stop_reason = None
+        self._steps = 0
+        self._started = time.monotonic()
+        self._deadline = self._started + self.timeout if self.timeout else None
+        self._budget_active = True
+        # the handler only acts for this run; the pool clears it from the
+        # connection on checkin in case _end_budget never gets to
+        self._run = object()
+
+    def _arm(self):
+        # Put the budget on the connection the next statement runs on. Each
+        # statement may get a different one: a write commits, the session
+        # checks its connection in and the pool clears the handler.
+        dialect = self.db.get_bind().dialect.name
+        dbapi_connection = self.db.connection().connection.dbapi_connection
+        if dialect == "sqlite":
+            self._raw = sqlite3_connection(dbapi_connection)
+            if self._raw is not None:
+                run = self._run
+                self._raw.set_progress_handler(lambda: self._progress(run), PROGRESS_INTERVAL)
+        elif dialect == "postgresql":
+            # no progress handler there: the server enforces what is left of
+            # the time limit, until this statement's transaction ends
+            self._raw = dbapi_connection
+            if self._deadline is not None:
+                remaining_ms = max(int((self._deadline - time.monotonic()) * 1000), 1)
+                self.db.execute(text(f"SET LOCAL statement_timeout = {remaining_ms}"))
+        else:
+            self._raw = None
+
+    def _note_cancelled(self, error):
+        # Postgres reports statement_timeout and cancel() the same way
+        if getattr(getattr(error, "orig", None), "pgcode", None) == QUERY_CANCELED:
+            self._stop_reason = "cancelled" if self._cancelled.is_set() else "timeout"
+
+    def _end_budget(self):
+        if not self._budget_active:
+            return
+        self._budget_active = False
+        self._run = None
+        if self._raw is not None and hasattr(self._raw, "set_progress_handler"):
+            try:
+                self._raw.set_progress_handler(None, 0)
+            except Exception:
+                pass  # connection was invalidated and closed after the interrupt
+        self._raw = None
+
+    def _finish(self):
+        self._end_budget()
+        if self._started is not None:
+            ADHOC_LATENCY.observe(time.monotonic() - self._started, self._kind or "UNKNOWN")
+
+    def _progress(self, run=None):
+        # returning non-zero makes SQLite abort the statement ("interrupted")
+        if not self._budget_active or run is not self._run:
+            return 0
+        try:
+            self._steps += 1
+            if self._cancelled.is_set():
+                self._stop_reason = "cancelled"
+            elif self._deadline is not None and time.monotonic() > self._deadline:
+                self._stop_reason = "timeout"
+            elif self.max_scan_steps is not None and self._steps * PROGRESS_INTERVAL > self.max_scan_steps:
+                self._stop_reason = "scan_limit"
+        except KeyboardInterrupt:
+            # Ctrl+C in the CLI lands here while SQLite is busy
+            self._stop_reason = "cancelled"
+        return 1 if self._stop_reason is not None else 0
+
+    def _cancelled_result(self):
+        elapsed_ms = round((time.monotonic() - self._started) * 1000, 1)
+        if self._stop_reason == "timeout":
+            message = f"Query cancelled: exceeded the {self.timeout:g}s time limit"
+        elif self._stop_reason == "scan_limit":
+            message = f"Query cancelled: exceeded the scan budget of {self.max_scan_steps} steps"
+        else:
+            message = "Query cancelled"
+        return {"error": message, "cancelled": True, "reason": self._stop_reason, "elapsed_ms": elapsed_ms}
+
+    def _budgeted(self, batches, summary, observed):
         try:
-            result = self.db.execute(text(query))
-            rows = result.fetchall()
-            
-            if rows:
-                columns = list(result.keys())
-                data = []
-                for row in rows:
-                    row_data = {}
-                    for i, col in enumerate(columns):
-                        row_data[col] = row[i]
-                    data.append(row_data)
-                return {"success": True, "data": data, "columns": columns}
+            yield from batches
+            self._observe(*observed)
+        except Exception as e:
+            self._note_cancelled(e)
+            if self._stop_reason is None:
+                raise
+            # rows already sent stay sent, the trailer says why it stopped
+            summary.update(self._cancelled_result())
+        finally:
+            self._finish()
+
+    def _observe(self, statement, params, started):
+        # feeds SHOW INDEX ADVICE, which reads SQLite query plans
+        if self.db.get_bind().dialect.name == "sqlite":
+            query_stats.observe(statement, params, time.monotonic() - started)
+
+    def _execute(self, statement, params=None, stream=False):
+        # stream_results asks drivers that have them for a server-side cursor
+        options = {"stream_results": True} if stream else {}
+        try:
+            return self.db.execute(statement.clause, params or {}, execution_options=options)
+        except DBAPIError as e:
+            self._note_cancelled(e)
+            raise
+
+    def _written(self):
+        if self.on_write is not None:
+            self.on_write()
+
+    def stream_select(self, statement, params=None, max_rows=None, batch_size=500):
+        # rows are pulled in fetchmany batches instead of one fetchall, so a
+        # big SELECT is never held in memory all at once. "summary" is filled
+        # in as the batches are consumed and is final once they run out.
+        try:
+            result = self._execute(statement, params, stream=True)
+        except Exception as e:
+            return {"error": f"SELECT query failed: {str(e)}"}
+
+        columns = list(result.keys())
+        summary = {"row_count": 0, "truncated": False}
+
+        def batches():
+            try:
+                while True:
+                    size = batch_size
+                    if max_rows is not None:
+                        size = min(size, max_rows - summary["row_count"])
+                        if size <= 0:
+                            # only report truncation if something was left behind
+                            summary["truncated"] = result.fetchone() is not None
+                            return
+                    rows = result.fetchmany(size)
+                    if not rows:
+                        return
+                    summary["row_count"] += len(rows)
+                    yield rows
+            finally:
+                result.close()
+
+        return {"success": True, "columns": columns, "batches": batches(), "summary": summary}
+
+    def handle_select(self, statement, params=None, max_rows=None):
+        try:
+            result = self.stream_select(statement, params, max_rows=max_rows)
+            if 'error' in result:
+                return result
+
+            columns = result["columns"]
+            data = [dict(zip(columns, row)) for batch in result["batches"] for row in batch]
+            truncated = result["summary"]["truncated"]
+            if data:
+                return {"success": True, "data": data, "columns": columns, "truncated": truncated}
             else:
                 return {"success": True, "data": [], "message": "No rows returned"}
                 
         except Exception as e:
             return {"error": f"SELECT query failed: {str(e)}"}
     
-    def handle_insert(self, query):
+    def handle_insert(self, statement, params=None):
         try:
-            result = self.db.execute(text(query))
+            result = self._execute(statement, params)
             self.db.commit()
+            self._written()
             return {"success": True, "message": f"Added {result.rowcount} row(s)"}
         except Exception as e:
             self.db.rollback()
             return {"error": f"INSERT failed: {str(e)}"}
     
-    def handle_update(self, query):
+    def handle_update(self, statement, params=None):
         try:
-            result = self.db.execute(text(query))
+            result = self._execute(statement, params)
             self.db.commit()
+            self._written()
             return {"success": True, "message": f"Changed {result.rowcount} row(s)"}
         except Exception as e:
             self.db.rollback()
             return {"error": f"UPDATE failed: {str(e)}"}
     
-    def handle_delete(self, query):
+    def handle_delete(self, statement, params=None):
         try:
-            result = self.db.execute(text(query))
+            result = self._execute(statement, params)
             self.db.commit()
+            self._written()
             return {"success": True, "message": f"Removed {result.rowcount} row(s)"}
         except Exception as e:
             self.db.rollback()
             return {"error": f"DELETE failed: {str(e)}"}
     
-    def handle_create(self, query):
+    def handle_create(self, statement, params=None):
         # basic CREATE TABLE support
         try:
-            result = self.db.execute(text(query))
+            result = self._execute(statement, params)
             self.db.commit()
+            self._written()
             return {"success": True, "message": "Table created successfully"}
         except Exception as e:
             self.db.rollback()
             return {"error": f"CREATE failed: {str(e)}"}
     
-    def handle_drop(self, query):
+    def handle_drop(self, statement, params=None):
         # basic DROP TABLE support
         try:
-            result = self.db.execute(text(query))
+            result = self._execute(statement, params)
             self.db.commit()
+            self._written()
             return {"success": True, "message": "Table dropped successfully"}
         except Exception as e:
             self.db.rollback()
             return {"error": f"DROP failed: {str(e)}"}
     
-    def handle_show(self, query):
+    def handle_show(self, statement):
         # basic SHOW commands
+        query = statement.sql
         query_upper = query.upper()
+        advice = re.match(r'SHOW\s+INDEX\s+ADVICE(?:\s+(APPLY|RESET))?$', query, re.IGNORECASE)
+        if advice:
+            return self.handle_index_advice((advice.group(1) or "").upper())
         if "TABLES" in query_upper:
             # get actual table names from database
             try:
@@ -143,4 +387,120 @@ class SimpleSQL:
             else:
                 return {"error": "Need to specify a table name"}
         else:
-            return {"error": "Only know SHOW TABLES, SHOW COLUMNS FROM table, and SHOW INDEXES FROM table"}
\ No newline at end of file
+            return {"error": "Only know SHOW TABLES, SHOW COLUMNS FROM table, SHOW INDEXES FROM table, and SHOW INDEX ADVICE [APPLY|RESET]"}
+
+    def handle_index_advice(self, action=""):
+        # SELECTs seen so far that scan whole tables or sort in temp
+        # B-trees, ranked by total time; APPLY creates the suggested indexes
+        if action == "RESET":
+            query_stats.reset()
+            return {"success": True, "message": "Index advice statistics cleared"}
+        if self.db.get_bind().dialect.name != "sqlite":
+            return {"error": "Index advice needs SQLite's EXPLAIN QUERY PLAN"}
+
+        rows, statements = query_stats.advice(self.db)
+        if action != "APPLY":
+            if not rows:
+                return {"success": True, "message": f"No full scans or temp B-tree sorts in {len(query_stats)} query shape(s) seen"}
+            return {"success": True, "data": rows, "columns": list(rows[0])}
+        if not statements:
+            return {"success": True, "message": "No indexes to create"}
+
+        # IF NOT EXISTS skips a name another worker (or an earlier APPLY)
+        # already took, so only count the names that weren't there before
+        existing = self._index_names()
+        try:
+            for create in statements:
+                self.db.execute(text(create))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            return {"error": f"Creating indexes failed: {str(e)}"}
+        new_names = self._index_names() - existing
+        # CREATE INDEX IF NOT EXISTS <name> ON ...
+        created = [create for create in statements if create.split()[5] in new_names]
+        return {
+            "success": True,
+            "data": [{"created": create} for create in created],
+            "message": f"Created {len(created)} index(es)",
+        }
+
+    def _index_names(self):
+        return {row[0] for row in self.db.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+    def handle_explain(self, statement, params=None):
+        # show the plan without running the statement, accepts both a bare
+        # statement (explain mode) and one written as EXPLAIN [QUERY PLAN] ...
+        target = statement.sql
+        if statement.kind == 'EXPLAIN':
+            target = re.sub(r'^EXPLAIN\s+(QUERY\s+PLAN\s+)?', '', target, flags=re.IGNORECASE)
+        if not target:
+            return {"error": "Nothing to explain"}
+
+        if self.db.get_bind().dialect.name != "sqlite":
+            plan = parse("EXPLAIN " + target)[0]
+            try:
+                rows = self._execute(plan, params).fetchall()
+            except Exception as e:
+                return {"error": f"EXPLAIN failed: {str(e)}"}
+            return {"success": True, "data": [{"detail": row[0]} for row in rows], "columns": ["detail"]}
+
+        plan = parse("EXPLAIN QUERY PLAN " + target)[0]
+        try:
+            rows = self._execute(plan, params).fetchall()
+        except Exception as e:
+            return {"error": f"EXPLAIN failed: {str(e)}"}
+
+        data = [{"id": row[0], "parent": row[1], "detail": row[3]} for row in rows]
+        # "SCAN table" with no index behind it reads every row
+        full_scans = [
+            row["detail"] for row in data
+            if row["detail"].startswith("SCAN ") and " USING " not in row["detail"]
+        ]
+        return {"success": True, "data": data, "columns": ["id", "parent", "detail"], "full_scans": full_scans}
+
+class AsyncSimpleSQL:
+    """SimpleSQL over an AsyncSession.
+
+    Statements go through the same SimpleSQL handlers, run on the session's
+    sync facade with run_sync so the event loop never blocks on the
+    database. Streamed SELECTs hand back an async generator of batches, each
+    one fetched the same way.
+    """
+
+    def __init__(self, async_session, **options):
+        self.db = async_session
+        self.engine = SimpleSQL(None, **options)
+
+    @property
+    def max_scan_steps(self):
+        return self.engine.max_scan_steps
+
+    @max_scan_steps.setter
+    def max_scan_steps(self, value):
+        self.engine.max_scan_steps = value
+
+    def cancel(self):
+        self.engine.cancel()
+
+    async def execute_query(self, query_str, params=None, stream=False, max_rows=None, batch_size=500, explain=False):
+        def run(session):
+            self.engine.db = session
+            return self.engine.execute_query(
+                query_str, params, stream=stream, max_rows=max_rows, batch_size=batch_size, explain=explain,
+            )
+
+        result = await self.db.run_sync(run)
+        if 'batches' in result:
+            result["batches"] = self._fetch(result["batches"])
+        return result
+
+    async def _fetch(self, batches):
+        try:
+            while True:
+                batch = await self.db.run_sync(lambda session: next(batches, None))
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            await self.db.run_sync(lambda session: batches.close())
@@ -0,0 +1,126 @@
+import asyncio
+
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from sql_engine import DEFAULT_MAX_SCAN_STEPS, DEFAULT_TIMEOUT
+from sql_parser import is_read_only
+from serialization import FastJSONResponse, dumps
+
+
+def read_sql_request(request):
+    """Validate a /sql request body, returning its options or an error dict."""
+    query = request.get('query', '')
+    if not query:
+        return {"error": "No query provided"}
+
+    # bound parameters for :name placeholders in the query
+    params = request.get('params')
+    if params is not None and not isinstance(params, dict):
+        return {"error": "params must be an object of :name values"}
+
+    # optional: "stream" for NDJSON output, "format": "columnar" for column
+    # chunks, "max_rows" to cap how many rows come back
+    max_rows = request.get('max_rows')
+    if max_rows is not None and (not isinstance(max_rows, int) or max_rows < 0):
+        return {"error": "max_rows must be a non-negative integer"}
+
+    # clients can ask for tighter limits than the server's, never looser ones
+    timeout = request.get('timeout', DEFAULT_TIMEOUT)
+    if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        return {"error": "timeout must be a positive number of seconds"}
+    if DEFAULT_TIMEOUT is not None:
+        timeout = min(timeout or DEFAULT_TIMEOUT, DEFAULT_TIMEOUT)
+
+    max_scan_steps = request.get('max_scan_steps', DEFAULT_MAX_SCAN_STEPS)
+    if max_scan_steps is not None and (not isinstance(max_scan_steps, int) or max_scan_steps <= 0):
+        return {"error": "max_scan_steps must be a positive integer"}
+    if DEFAULT_MAX_SCAN_STEPS is not None:
+        max_scan_steps = min(max_scan_steps or DEFAULT_MAX_SCAN_STEPS, DEFAULT_MAX_SCAN_STEPS)
+
+    # "explain" returns the query plan instead of running the query
+    explain = bool(request.get('explain', False))
+
+    return {
+        "query": query,
+        "params": params,
+        "explain": explain,
+        # reads don't need to wait for the single write connection
+        "read_only": explain or is_read_only(query),
+        "stream": bool(request.get('stream', False)),
+        "columnar": request.get('format') == 'columnar',
+        "max_rows": max_rows,
+        "timeout": timeout,
+        "max_scan_steps": max_scan_steps,
+    }
+
+
+async def stream_sql_rows(result, columnar=False):
+    # NDJSON: a header line with the column names, then one JSON array per
+    # row (or one object of column arrays per batch when columnar), then a
+    # trailer with the row count and whether max_rows cut the result short
+    columns = result["columns"]
+    yield dumps({"columns": columns}) + b"\n"
+    batches = result["batches"]
+    if not hasattr(batches, "__aiter__"):
+        # sync batches block in fetchmany, so pull them on the threadpool
+        batches = iterate_in_threadpool(batches)
+    try:
+        async for batch in batches:
+            if columnar:
+                chunk = {col: list(values) for col, values in zip(columns, zip(*batch))}
+                yield dumps({"chunk": chunk}) + b"\n"
+            else:
+                yield b"".join(dumps(list(row)) + b"\n" for row in batch)
+    except Exception as e:
+        yield dumps({"error": f"SELECT query failed: {str(e)}"}) + b"\n"
+        return
+    yield dumps({"done": True, **result["summary"]}) + b"\n"
+
+
+async def cancel_on_disconnect(http_request, sql_engine):
+    # the query is busy in a worker thread (or the driver's), so poll for
+    # the client going away
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(0.25)
+    sql_engine.cancel()
+
+
+async def stream_until_disconnect(result, columnar, sql_engine, watcher):
+    batches = result["batches"]
+    try:
+        async for line in stream_sql_rows(result, columnar):
+            yield line
+    finally:
+        # stop the query if we never got to the end of it
+        watcher.cancel()
+        sql_engine.cancel()
+        if hasattr(batches, "aclose"):
+            await batches.aclose()
+        else:
+            batches.close()
+
+
+async def run_sql_request(http_request, sql_engine, options, execute):
+    """Run execute(...) for a /sql request, cancelling it if the client leaves.
+
+    execute is an async callable taking the execute_query arguments, so the
+    same flow serves the threadpool-backed sync engine and the async one.
+    """
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, sql_engine))
+    try:
+        result = await execute(
+            options["query"], options["params"],
+            stream=options["stream"], max_rows=options["max_rows"], explain=options["explain"],
+        )
+    except BaseException:
+        watcher.cancel()
+        raise
+
+    if 'batches' in result:
+        return StreamingResponse(
+            stream_until_disconnect(result, options["columnar"], sql_engine, watcher),
+            media_type="application/x-ndjson",
+        )
+    watcher.cancel()
+    return FastJSONResponse(result)
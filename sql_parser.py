@@ -0,0 +1,171 @@
+import re
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+# one alternative per token kind, tried in order
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<param>[:@$][A-Za-z_]\w*|\?\d*)
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<semicolon>;)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+# statement kinds a WITH clause can lead into
+CTE_BODY_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE"}
+
+# statement kinds that never write, so they can run on a read-only connection
+READ_ONLY_KINDS = {"SELECT", "SHOW", "EXPLAIN"}
+
+
+def tokenize(sql):
+    """Split SQL into (kind, text) tokens.
+
+    Comments and whitespace come back as tokens too so callers can decide
+    what to do with them; string literals and quoted identifiers are kept
+    whole so nothing inside them is ever mistaken for a keyword or ';'.
+    """
+    return [(match.lastgroup, match.group()) for match in TOKEN_RE.finditer(sql)]
+
+
+def split_statements(sql):
+    """Split SQL on top-level semicolons, returning a token list per statement."""
+    statements = []
+    current = []
+    for token in tokenize(sql):
+        if token[0] == "semicolon":
+            statements.append(current)
+            current = []
+        else:
+            current.append(token)
+    statements.append(current)
+    # drop statements that are nothing but whitespace and comments
+    return [tokens for tokens in statements if any(kind not in ("space", "comment") for kind, _ in tokens)]
+
+
+def normalize(tokens, escape_colons=False):
+    """Rebuild a statement with comments dropped and whitespace collapsed.
+
+    Everything else is kept byte for byte, including the case of names, so
+    the columns SQLite reports for a SELECT don't change.
+    """
+    parts = []
+    for kind, value in tokens:
+        if kind in ("space", "comment"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif escape_colons and kind in ("string", "quoted"):
+            # text() treats any ":name" as a bind parameter, even inside a
+            # string literal, so escape the colons we know aren't parameters
+            parts.append(value.replace(":", "\\:"))
+        else:
+            parts.append(value)
+    return "".join(parts).strip()
+
+
+def query_shape(tokens):
+    """The statement with comments dropped, whitespace collapsed and literals
+    and bind parameters replaced by ?, so runs that differ only in their
+    values share a shape."""
+    parts = []
+    for kind, value in tokens:
+        if kind in ("space", "comment"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif kind in ("string", "number", "param"):
+            parts.append("?")
+        else:
+            parts.append(value)
+    return "".join(parts).strip()
+
+
+def statement_kind(tokens):
+    """Return the leading keyword of a statement, looking through WITH clauses."""
+    words = [(kind, value) for kind, value in tokens if kind not in ("space", "comment")]
+    if not words or words[0][0] != "word":
+        return None
+    kind = words[0][1].upper()
+    if kind == "WITH":
+        # the statement proper is the first DML keyword outside the CTE bodies
+        depth = 0
+        for token_kind, value in words[1:]:
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+            elif depth == 0 and token_kind == "word" and value.upper() in CTE_BODY_KINDS:
+                return value.upper()
+        return None
+    if kind == "VALUES":
+        return "SELECT"
+    return kind
+
+
+class Statement:
+    __slots__ = ("sql", "kind", "clause", "shape")
+
+    def __init__(self, tokens):
+        self.sql = normalize(tokens)
+        self.kind = statement_kind(tokens)
+        self.shape = query_shape(tokens)
+        self.clause = text(normalize(tokens, escape_colons=True))
+
+
+class StatementCache:
+    """LRU of parsed statements keyed by their normalized SQL.
+
+    Holding on to the text() clause means repeated queries skip classifying
+    and bind-parameter parsing, and always hit SQLAlchemy's compiled cache
+    and the driver's prepared-statement cache with the same SQL string.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tokens):
+        key = normalize(tokens)
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is not None:
+                self._statements.move_to_end(key)
+                self.hits += 1
+                return statement
+            self.misses += 1
+        statement = Statement(tokens)
+        with self._lock:
+            self._statements[key] = statement
+            while len(self._statements) > self.maxsize:
+                self._statements.popitem(last=False)
+        return statement
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+
+
+statement_cache = StatementCache()
+
+
+def parse(sql):
+    """Parse SQL into a list of cached Statement objects, one per statement."""
+    return [statement_cache.get(tokens) for tokens in split_statements(sql)]
+
+
+def is_read_only(sql):
+    """True when every statement in the SQL is one that only reads."""
+    statements = parse(sql)
+    return bool(statements) and all(
+        # SHOW INDEX ADVICE APPLY creates indexes
+        statement.kind in READ_ONLY_KINDS and not statement.sql.upper().endswith(" APPLY")
+        for statement in statements
+    )
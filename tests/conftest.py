@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# the app reads its settings on import, so point it at a scratch database
+# (never the checked-in database.db) before anything imports it
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("CHANGES_COMPACT_INTERVAL", "0")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+    from manage import migrate
+
+    migrate(seed=True)
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def db():
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
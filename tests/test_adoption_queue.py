@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import metrics
+from adoption_queue import AdoptionQueue, is_transient
+
+
+def events():
+    return {key[0]: value for key, value in metrics.ADOPTION_QUEUE_EVENTS._values.items()}
+
+
+def request(user_id, animal_id):
+    return {"user_id": user_id, "animal_id": animal_id, "message": "queued", "created_at": datetime.now(timezone.utc)}
+
+
+@pytest.fixture
+def database_file(client):
+    from database import engine
+
+    return engine.url.database
+
+
+@pytest.fixture
+def user_id(db):
+    db.execute(text("INSERT INTO users (username, email, password) VALUES ('queue', 'queue@example.com', 'x')"))
+    db.commit()
+    yield db.execute(text("SELECT id FROM users WHERE username = 'queue'")).scalar()
+    db.execute(text("DELETE FROM adoptions WHERE user_id IN (SELECT id FROM users WHERE username = 'queue')"))
+    db.execute(text("DELETE FROM users WHERE username = 'queue'"))
+    db.commit()
+
+
+def test_a_bad_row_only_drops_itself(database_file, user_id, db):
+    bind = create_engine(f"sqlite:///{database_file}")
+
+    @event.listens_for(bind, "connect")
+    def foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    before = events()
+    AdoptionQueue(bind=bind)._write([request(user_id, 1), request(user_id, 999999), request(user_id, 2)])
+    after = events()
+    assert after.get("written", 0) - before.get("written", 0) == 2
+    assert after.get("failed", 0) - before.get("failed", 0) == 1
+    stored = db.execute(text("SELECT animal_id FROM adoptions WHERE user_id = :user ORDER BY animal_id"), {"user": user_id})
+    assert [row[0] for row in stored] == [1, 2]
+
+
+def test_a_permanent_operational_error_is_not_retried():
+    # an empty database: "no such table" is an OperationalError too
+    bind = create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "empty.db"))
+    before = events()
+    started = time.monotonic()
+    AdoptionQueue(bind=bind)._write([request(1, 1), request(1, 2)])
+    assert time.monotonic() - started < 1
+    assert events().get("failed", 0) - before.get("failed", 0) == 2
+
+
+def test_a_locked_database_is_retried_until_it_clears(database_file, user_id):
+    bind = create_engine(f"sqlite:///{database_file}", connect_args={"timeout": 0})
+    holder = sqlite3.connect(database_file, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN EXCLUSIVE")
+    try:
+        with pytest.raises(Exception) as locked:
+            with bind.begin() as conn:
+                conn.execute(text("INSERT INTO adoptions (user_id, animal_id) VALUES (:user, 3)"), {"user": user_id})
+        assert is_transient(locked.value)
+
+        threading.Timer(1.5, holder.rollback).start()
+        written, error = AdoptionQueue(bind=bind)._insert([request(user_id, 3)], retries=5)
+    finally:
+        time.sleep(0.1)
+        holder.close()
+    assert (written, error) == (1, None)
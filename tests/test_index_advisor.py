@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import text
+
+INDEX = "ix_adoptions_message_created_at"
+
+
+def run_sql(client, query):
+    response = client.post("/sql", json={"query": query})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def advice(client, db):
+    run_sql(client, "SHOW INDEX ADVICE RESET")
+    yield lambda action="": run_sql(client, f"SHOW INDEX ADVICE {action}")
+    run_sql(client, "SHOW INDEX ADVICE RESET")
+    db.execute(text(f"DROP INDEX IF EXISTS {INDEX}"))
+    db.commit()
+
+
+def test_suggestions_are_lowercase_and_skip_prefixes(client, advice):
+    run_sql(client, "SELECT id FROM Adoptions WHERE Message = 'a'")
+    run_sql(client, "SELECT id FROM adoptions WHERE message = 'b'")
+    run_sql(client, "SELECT id, created_at FROM adoptions WHERE message = 'c' AND created_at > '2020'")
+
+    rows = advice()["data"]
+    assert len(rows) == 3
+    # the (message) index is a prefix of (message, created_at), which serves all three
+    create = f"CREATE INDEX IF NOT EXISTS {INDEX} ON adoptions (message, created_at)"
+    assert {row["suggestion"] for row in rows} == {create}
+
+    result = advice("APPLY")
+    assert result["message"] == "Created 1 index(es)"
+    assert result["data"] == [{"created": create}]
+    assert advice("APPLY")["message"] == "No indexes to create"
+
+
+def test_apply_only_counts_indexes_it_created(client, advice, db):
+    run_sql(client, "SELECT id, created_at FROM adoptions WHERE message = 'c' AND created_at > '2020'")
+    # the name is taken by an index on other columns, IF NOT EXISTS skips it
+    db.execute(text(f"CREATE INDEX {INDEX} ON adoptions (user_id)"))
+    db.commit()
+
+    result = advice("APPLY")
+    assert result["message"] == "Created 0 index(es)"
+    assert result["data"] == []
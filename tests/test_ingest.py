@@ -0,0 +1,46 @@
+import json
+
+from sqlalchemy import text
+
+from ingest import ANIMAL_INSERT_TRIGGERS
+
+
+def animal(**values):
+    return {
+        "name": "Quillon", "species": "Dog", "breed": "Ingest Test Hound", "age": 2,
+        "description": "Bulk loaded", "center_id": 1, **values,
+    }
+
+
+def upload(client, records):
+    body = "\n".join(json.dumps(record) for record in records)
+    response = client.post("/animals/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def insert_triggers(db):
+    names = ", ".join(f"'{name}'" for name in ANIMAL_INSERT_TRIGGERS)
+    return {row[0] for row in db.execute(text(f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({names})"))}
+
+
+def test_bulk_upload_maintains_search_and_facets(client, db):
+    result = upload(client, [animal(name="Bramblewick"), animal(name="Bramblewick")])
+    assert (result["inserted"], result["failed"]) == (2, 0)
+    assert insert_triggers(db) == set(ANIMAL_INSERT_TRIGGERS)
+    assert [row["name"] for row in client.get("/animals/search", params={"q": "Bramblewick"}).json()] == ["Bramblewick"] * 2
+    assert client.get("/animals/facets").json()["breed"]["Ingest Test Hound"] >= 2
+
+
+def test_failed_batch_keeps_insert_triggers(client, db):
+    # an age SQLite can't store fails the batch insert, the rows then go one by one
+    facets = client.get("/animals/facets").json()["breed"].get("Ingest Test Hound", 0)
+    result = upload(client, [animal(name="Thistledown"), animal(name="Overflow", age=10 ** 20)])
+    assert (result["inserted"], result["failed"]) == (1, 1)
+    assert result["errors"][0]["row"] == 2
+
+    assert insert_triggers(db) == set(ANIMAL_INSERT_TRIGGERS)
+    assert [row["name"] for row in client.get("/animals/search", params={"q": "Thistledown"}).json()] == ["Thistledown"]
+    assert client.get("/animals/facets").json()["breed"]["Ingest Test Hound"] == facets + 1
+    version = db.execute(text("SELECT max(version) FROM change_log WHERE table_name = 'animals' AND op = 'upsert'")).scalar()
+    assert version is not None
@@ -0,0 +1,31 @@
+import json
+
+import search
+
+
+def add_animals(client, animals):
+    body = "\n".join(json.dumps(animal) for animal in animals)
+    response = client.post("/animals/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.json()["inserted"] == len(animals)
+
+
+def animal(name, description):
+    return {"name": name, "species": "Cat", "breed": "Tabby", "age": 3, "description": description, "center_id": 1}
+
+
+def test_older_better_matches_outrank_newer_ones(client, monkeypatch):
+    # the name match is added first, then plenty of newer description matches
+    add_animals(client, [animal("Marzipan", "Sleepy")])
+    add_animals(client, [animal(f"Pebble{i}", "Loves marzipan treats and long naps in the sun") for i in range(30)])
+
+    response = client.get("/animals/search", params={"q": "marzipan", "limit": 5})
+    assert response.json()[0]["name"] == "Marzipan"
+    assert "X-Search-Candidate-Limit" not in response.headers
+    page = client.get("/animals/search", params={"q": "marzipan", "limit": 5, "offset": 28}).json()
+    assert len(page) == 3
+
+    # with a cap only the newest matches are ranked, and the response says so
+    monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 10)
+    response = client.get("/animals/search", params={"q": "marzipan", "limit": 6})
+    assert "Marzipan" not in [row["name"] for row in response.json()]
+    assert response.headers["X-Search-Candidate-Limit"] == "10"
@@ -0,0 +1,37 @@
+import time
+
+# counts to a hundred million, far past any time budget used here
+SLOW_SELECT = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 100000000) SELECT count(*) FROM c"
+
+
+def run_sql(client, query, **options):
+    response = client.post("/sql", json={"query": query, **options})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_timeout_cancels_a_slow_select(client):
+    started = time.monotonic()
+    result = run_sql(client, SLOW_SELECT, timeout=0.5)
+    assert result["cancelled"] and result["reason"] == "timeout"
+    assert time.monotonic() - started < 5
+
+
+def test_timeout_still_applies_after_a_write_commits(client):
+    # the write checks its connection in, which clears the progress handler
+    started = time.monotonic()
+    result = run_sql(client, f"UPDATE animals SET age = age WHERE id = 1; {SLOW_SELECT}", timeout=0.5)
+    first, second = result["results"]
+    assert first["success"]
+    assert second["cancelled"] and second["reason"] == "timeout"
+    assert time.monotonic() - started < 5
+
+
+def test_scan_budget_applies_to_every_statement(client):
+    result = run_sql(client, f"SELECT 1; UPDATE animals SET age = age WHERE id = 1; {SLOW_SELECT}", max_scan_steps=100000)
+    assert [step.get("reason") for step in result["results"]] == [None, None, "scan_limit"]
+
+
+def test_connection_is_usable_after_a_cancelled_query(client):
+    run_sql(client, SLOW_SELECT, timeout=0.2)
+    assert run_sql(client, "SELECT count(*) AS n FROM animals")["data"][0]["n"] > 0
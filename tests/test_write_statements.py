@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+ANIMAL = {"name": "Tally", "species": "Dog", "breed": "Mixed", "age": 3, "description": "Statement counting", "center_id": 1}
+
+
+@pytest.fixture
+def count_statements(client):
+    from database import async_engine, engine, read_engine
+
+    engines = {engine, read_engine}
+    if async_engine is not None:
+        engines.add(async_engine.sync_engine)
+
+    @contextmanager
+    def counting():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        for bind in engines:
+            event.listen(bind, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            for bind in engines:
+                event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+    return counting
+
+
+def call(client, count_statements, method, path, body=None, expect=200):
+    with count_statements() as statements:
+        response = client.request(method, path, json=body)
+    assert response.status_code == expect, response.text
+    return response, statements
+
+
+def test_account_statements(client, count_statements):
+    # uniqueness comes from the constraints, so a conflict costs no extra lookup
+    user = {"username": "tally", "email": "tally@example.com", "password": "secret"}
+    paths = [
+        ("POST", "/register", user, 200),
+        ("POST", "/register", user, 400),
+        ("POST", "/register", {**user, "username": "tally2"}, 400),
+        ("POST", "/login", {"username": "tally", "password": "secret"}, 200),
+        ("POST", "/login", {"username": "nobody", "password": "secret"}, 400),
+    ]
+    for method, path, body, expect in paths:
+        response, statements = call(client, count_statements, method, path, body, expect)
+        assert len(statements) == 1, (method, path, statements)
+
+
+def test_animal_statements(client, count_statements):
+    # RETURNING instead of a refresh, UPDATE/DELETE by id with no load first
+    response, statements = call(client, count_statements, "POST", "/animals", ANIMAL)
+    assert len(statements) == 1, statements
+    animal_id = response.json()["id"]
+
+    paths = [
+        ("POST", "/adopt", {"user_id": 1, "animal_id": animal_id, "message": "Hello"}, 200),
+        ("PUT", f"/animals/{animal_id}", {"age": 4}, 200),
+        ("DELETE", f"/animals/{animal_id}", None, 200),
+        ("PUT", f"/animals/{animal_id}", {"age": 5}, 404),
+        ("DELETE", f"/animals/{animal_id}", None, 404),
+    ]
+    for method, path, body, expect in paths:
+        response, statements = call(client, count_statements, method, path, body, expect)
+        assert len(statements) == 1, (method, path, statements)